@@ -84,6 +84,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # wait for the write lock instead of failing under concurrent submissions
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -165,3 +167,127 @@ EMAIL_HOST_PASSWORD = "your_app_password"
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
+
+# Challenge environments
+# Compose runs (starts, stops, teardowns) allowed against each Docker daemon
+# at once, across all processes; they hold DB-leased slots while running
+CHALLENGE_JOB_CONCURRENCY = int(os.environ.get("CHALLENGE_JOB_CONCURRENCY", 4))
+# Jobs still starting this many seconds after their last update lost their
+# worker (restart, crash) and are failed by the scheduler. Also how long a
+# dead holder keeps a compose slot
+CHALLENGE_JOB_STALE_AFTER = 900
+# Jobs still pending this long may have been lost from a worker pool's queue
+# and are resubmitted; a job that was only waiting its turn still runs once
+CHALLENGE_JOB_PENDING_STALE_AFTER = 30
+CHALLENGE_JOB_RECOVERY_INTERVAL = 60
+# Host ports handed out to isolated instances (inclusive)
+CHALLENGE_PORT_RANGE = (20000, 60000)
+# Container backend: ComposeCLIBackend (docker-compose CLI), DockerAPIBackend
+# (Docker Engine API over a pooled connection) or FakeBackend (in-memory, for tests)
+CHALLENGE_BACKEND = os.environ.get("CHALLENGE_BACKEND", "challenges.backends.ComposeCLIBackend")
+CHALLENGE_BACKEND_OPTIONS = {}
+# Default instance lifetime in seconds (CTFChallenge.instance_ttl overrides it);
+# a shared stack lives this long after the last request to start it
+CHALLENGE_INSTANCE_TTL = 30 * 60
+# Reaper: longest sleep between deadline checks, and parallel teardowns
+CHALLENGE_REAPER_MAX_SLEEP = 5
+CHALLENGE_REAPER_CONCURRENCY = 8
+# Scheduler (manage.py run_scheduler): leader lease lifetime and loop tick in seconds
+CHALLENGE_SCHEDULER_LEASE_TTL = 30
+CHALLENGE_SCHEDULER_TICK = 1
+CHALLENGE_WARM_POOL_INTERVAL = 30
+# Shared stack state is cached for this many seconds and refreshed by the
+# scheduler's status snapshot
+CHALLENGE_SHARED_STATE_TTL = 15
+
+# The cache must be shared by every process: the web workers read what the
+# scheduler and event watcher write (container states, fragment versions,
+# the scoreboard change log), so a per-process LocMemCache is rejected by a
+# system check. Set REDIS_URL in production; the file cache default works
+# for a single host, but its counters are not atomic, so the in-memory
+# scoreboard needs Redis (or Memcached) and reads the database without it
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache",
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        }
+    }
+# manage.py test swaps in a fresh in-memory cache per run (CTF.test_runner)
+TEST_RUNNER = "CTF.test_runner.TestRunner"
+# Readiness probing of new instances: host the published ports are reachable
+# on, seconds between probe rounds, per-probe timeout, and when to give up
+CHALLENGE_PROBE_HOST = "127.0.0.1"
+CHALLENGE_PROBE_INTERVAL = 1
+CHALLENGE_PROBE_TIMEOUT = 2
+CHALLENGE_READINESS_TIMEOUT = 120
+# Host players use to reach instances on the default daemon; instances placed
+# on a DockerNode use that node's public_host instead. Add DockerNode rows
+# (admin) to spread isolated instances over several daemons; with
+# CHALLENGE_BACKEND = FakeBackend every node gets its own in-memory fake.
+CHALLENGE_PUBLIC_HOST = "127.0.0.1"
+# Picking a node and leasing its port happen under one DB lease at a time,
+# held at most CHALLENGE_PLACEMENT_LEASE_TTL seconds if its holder dies
+CHALLENGE_PLACEMENT_LEASE_TTL = 30
+# Admission control for isolated instances (None: no cap). Spawns over a cap
+# wait in a per-user round-robin queue; a full queue answers 429 + Retry-After.
+# Idle warm-pool instances count against the memory cap. One process admits
+# at a time, under a DB lease held at most CHALLENGE_ADMISSION_LEASE_TTL seconds
+CHALLENGE_MAX_INSTANCES = None
+CHALLENGE_MAX_INSTANCES_PER_USER = 3
+CHALLENGE_MAX_RESERVED_MEMORY_MB = None
+CHALLENGE_ADMISSION_QUEUE_SIZE = 500
+CHALLENGE_ADMISSION_QUEUE_TIMEOUT = 600
+CHALLENGE_ADMISSION_RETRY_AFTER = 30
+CHALLENGE_ADMISSION_INTERVAL = 1
+CHALLENGE_ADMISSION_LEASE_TTL = 30
+# manage.py build_images: where challenge folders live and how many images build at once
+CHALLENGE_CONTAINERS_DIR = BASE_DIR / "containers"
+CHALLENGE_BUILD_CONCURRENCY = 4
+# Reconciliation of instance rows against what the daemons really run, every
+# CHALLENGE_RECONCILE_INTERVAL seconds (and when a scheduler becomes leader);
+# rows younger than the grace period are never treated as missing
+CHALLENGE_RECONCILE_INTERVAL = 60
+CHALLENGE_RECONCILE_GRACE = 120
+# Every CHALLENGE_STATUS_SNAPSHOT_INTERVAL seconds the scheduler lists all
+# containers (one call per daemon) into the cache; pages, admin and the job
+# API read instance state from there. Entries expire after the TTL, so a
+# stopped scheduler shows up as "unknown" rather than stale "running"
+CHALLENGE_STATUS_SNAPSHOT_INTERVAL = 5
+CHALLENGE_STATUS_SNAPSHOT_TTL = 15
+# manage.py watch_events: longest wait (seconds) before reopening a dropped
+# Docker event stream; each reconnect reconciles that daemon first
+CHALLENGE_EVENTS_MAX_BACKOFF = 30
+# In-memory scoreboard (user_management.scoreboard): workers replay a change
+# log kept in CACHES; they rebuild from the database when they fall more than
+# SCOREBOARD_MAX_LAG changes behind or a change is missing for longer than
+# SCOREBOARD_GAP_TIMEOUT seconds (log entries live SCOREBOARD_CHANGE_TTL seconds).
+# The log needs a cache with atomic incr (Redis, Memcached); with any other
+# the scoreboard reads the indexed ranking from the database instead
+SCOREBOARD_CHANGE_TTL = 3600
+SCOREBOARD_MAX_LAG = 1000
+SCOREBOARD_GAP_TIMEOUT = 5
+# Live scoreboard stream (/scoreboard/stream/, served by the ASGI app, e.g.
+# `uvicorn CTF.asgi:application`): players pushed, seconds between coalesced
+# pushes, per-client buffer, keep-alive period and how long one stream lasts
+# before the browser reconnects
+SCOREBOARD_STREAM_SIZE = 50
+SCOREBOARD_PUSH_INTERVAL = 1
+SCOREBOARD_STREAM_BUFFER = 100
+SCOREBOARD_KEEPALIVE = 15
+SCOREBOARD_STREAM_MAX_AGE = 300
+# Challenge list filter facets (with counts) are cached this many seconds;
+# saving or deleting a challenge clears them at once
+CHALLENGE_FACETS_TTL = 300
+# Challenge list/detail fragments (challenges.fragments) live this many
+# seconds in CACHES; edits, solves and instance start/stop retire the
+# affected ones at once. `manage.py fragment_stats` shows hit ratios
+CHALLENGE_FRAGMENT_TTL = 600
@@ -1,6 +1,26 @@
 from django.contrib import admin
-from .models import CTFChallenge, CompletedChallenge, ActiveContainer
+from .models import CTFChallenge, CompletedChallenge, ActiveContainer, SpawnJob, WarmInstance, PortLease, DockerNode
 
-admin.site.register(CTFChallenge)
+
+class CTFChallengeAdmin(admin.ModelAdmin):
+    # maintained by challenges.scoring; save() re-prices after pricing edits
+    readonly_fields = ('solve_count', 'current_points')
+
+
+class ActiveContainerAdmin(admin.ModelAdmin):
+    list_display = ('project_name', 'user', 'challenge', 'node', 'host_port', 'status', 'live_state', 'expires_at')
+    list_select_related = ('user', 'challenge', 'node')
+
+    @admin.display(description='Live state')
+    def live_state(self, obj):
+        # read from the cached status snapshot, never from Docker
+        return obj.container_state or 'unknown'
+
+
+admin.site.register(CTFChallenge, CTFChallengeAdmin)
 admin.site.register(CompletedChallenge)
-admin.site.register(ActiveContainer)
+admin.site.register(ActiveContainer, ActiveContainerAdmin)
+admin.site.register(SpawnJob)
+admin.site.register(WarmInstance)
+admin.site.register(PortLease)
+admin.site.register(DockerNode)
@@ -0,0 +1,206 @@
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import ActiveContainer, SpawnJob, WarmInstance
+from .scheduler import acquire_lease, default_holder, release_lease
+
+ADMISSION_LEASE = 'challenges-admission'
+
+# why a job could not be admitted; global limits block everyone behind it,
+# per-user/per-challenge limits only block that job
+GLOBAL_LIMIT = 'global'
+USER_LIMIT = 'user'
+CHALLENGE_LIMIT = 'challenge'
+
+
+class AdmissionQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("The launch queue is full, try again later.")
+        self.retry_after = retry_after
+
+
+def _in_flight():
+    """
+    Isolated spawns that are admitted but have no ActiveContainer yet.
+    """
+    return SpawnJob.objects.filter(
+        action=SpawnJob.SPAWN,
+        status__in=[SpawnJob.PENDING, SpawnJob.STARTING],
+        challenge__is_isolated=True,
+    )
+
+
+@contextmanager
+def admission_lease():
+    """
+    Yields True while this caller is the only one admitting spawns, False
+    if someone else is. Deciding from a usage snapshot and then admitting
+    must not interleave between processes, or each would fill the same free
+    capacity. A dispatcher that finds the lease taken can skip its turn:
+    whoever holds it (or the scheduler's next tick) admits the queue.
+    """
+    holder = f"{default_holder()}:{uuid.uuid4().hex[:8]}"
+    held = acquire_lease(holder, getattr(settings, 'CHALLENGE_ADMISSION_LEASE_TTL', 30), ADMISSION_LEASE)
+    try:
+        yield held
+    finally:
+        if held:
+            release_lease(holder, ADMISSION_LEASE)
+
+
+def usage_snapshot():
+    """
+    Instances and reserved memory counted against the caps: live isolated
+    instances plus admitted spawns still starting. Idle warm-pool instances
+    reserve memory too; a spawn that will take one of them needs none.
+    """
+    snapshot = {'total': 0, 'memory_mb': 0, 'users': Counter(), 'challenges': Counter(), 'warm': Counter()}
+    for row in WarmInstance.objects.values('challenge').annotate(
+        n=Count('id'), memory_mb=Sum('challenge__memory_reservation_mb')
+    ):
+        snapshot['memory_mb'] += row['memory_mb'] or 0
+        snapshot['warm'][row['challenge']] += row['n']
+    for qs in (ActiveContainer.objects.all(), _in_flight()):
+        totals = qs.aggregate(total=Count('id'), memory_mb=Sum('challenge__memory_reservation_mb'))
+        snapshot['total'] += totals['total']
+        snapshot['memory_mb'] += totals['memory_mb'] or 0
+        for row in qs.values('user').annotate(n=Count('id')):
+            snapshot['users'][row['user']] += row['n']
+        for row in qs.values('challenge').annotate(n=Count('id')):
+            snapshot['challenges'][row['challenge']] += row['n']
+    return snapshot
+
+
+def blocking_limit(snapshot, user_id, challenge):
+    """
+    The cap one more instance would exceed, or None if it fits.
+    """
+    max_total = getattr(settings, 'CHALLENGE_MAX_INSTANCES', None)
+    max_memory = getattr(settings, 'CHALLENGE_MAX_RESERVED_MEMORY_MB', None)
+    max_per_user = getattr(settings, 'CHALLENGE_MAX_INSTANCES_PER_USER', None)
+
+    if max_total is not None and snapshot['total'] >= max_total:
+        return GLOBAL_LIMIT
+    if max_memory is not None and not snapshot['warm'][challenge.id]:
+        if snapshot['memory_mb'] + challenge.memory_reservation_mb > max_memory:
+            return GLOBAL_LIMIT
+    if max_per_user is not None and snapshot['users'][user_id] >= max_per_user:
+        return USER_LIMIT
+    if challenge.max_instances is not None and snapshot['challenges'][challenge.id] >= challenge.max_instances:
+        return CHALLENGE_LIMIT
+    return None
+
+
+def _count(snapshot, user_id, challenge):
+    snapshot['total'] += 1
+    if snapshot['warm'][challenge.id]:
+        # takes over a warm instance whose memory is already counted
+        snapshot['warm'][challenge.id] -= 1
+    else:
+        snapshot['memory_mb'] += challenge.memory_reservation_mb
+    snapshot['users'][user_id] += 1
+    snapshot['challenges'][challenge.id] += 1
+
+
+def fair_order(jobs):
+    """
+    Per-user round-robin: everyone's oldest queued job first, then everyone's
+    second oldest, and so on; ties broken by queue time.
+    """
+    rank = Counter()
+    keyed = []
+    for job in sorted(jobs, key=lambda j: (j.created_at, j.id)):
+        keyed.append((rank[job.user_id], job.created_at, job.id, job))
+        rank[job.user_id] += 1
+    return [job for *_, job in sorted(keyed, key=lambda k: k[:3])]
+
+
+def queued_jobs():
+    return fair_order(SpawnJob.objects.filter(status=SpawnJob.QUEUED).select_related('challenge'))
+
+
+def queue_position(job):
+    """
+    1-based position of a queued job in the fair order, or None.
+    """
+    if job.status != SpawnJob.QUEUED:
+        return None
+    for position, queued in enumerate(queued_jobs(), start=1):
+        if queued.id == job.id:
+            return position
+    return None
+
+
+def warm_memory_fits(challenge):
+    """
+    True if one more idle warm instance of the challenge stays under
+    CHALLENGE_MAX_RESERVED_MEMORY_MB.
+    """
+    max_memory = getattr(settings, 'CHALLENGE_MAX_RESERVED_MEMORY_MB', None)
+    if max_memory is None:
+        return True
+    return usage_snapshot()['memory_mb'] + challenge.memory_reservation_mb <= max_memory
+
+
+def can_admit_now(user, challenge):
+    """
+    True if nobody is waiting and one more instance fits under every cap.
+    Call it holding admission_lease().
+    """
+    if SpawnJob.objects.filter(status=SpawnJob.QUEUED).exists():
+        return False
+    return blocking_limit(usage_snapshot(), user.id, challenge) is None
+
+
+def check_queue_space():
+    max_queue = getattr(settings, 'CHALLENGE_ADMISSION_QUEUE_SIZE', 500)
+    if SpawnJob.objects.filter(status=SpawnJob.QUEUED).count() >= max_queue:
+        raise AdmissionQueueFull(getattr(settings, 'CHALLENGE_ADMISSION_RETRY_AFTER', 30))
+
+
+def dispatch_queue():
+    """
+    Admit queued spawns in fair order while they fit under the caps and hand
+    them to the job workers. Also fails jobs that waited longer than
+    CHALLENGE_ADMISSION_QUEUE_TIMEOUT. Returns the number admitted.
+    Runs on every enqueue and as a scheduler task, one caller at a time.
+    """
+    with admission_lease() as held:
+        if not held:
+            return 0
+        return _dispatch()
+
+
+def _dispatch():
+    from .jobs import submit_job
+
+    timeout = getattr(settings, 'CHALLENGE_ADMISSION_QUEUE_TIMEOUT', 600)
+    SpawnJob.objects.filter(
+        status=SpawnJob.QUEUED,
+        created_at__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=SpawnJob.FAILED, error="Timed out waiting in the launch queue.")
+
+    jobs = queued_jobs()
+    if not jobs:
+        return 0
+
+    admitted = 0
+    snapshot = usage_snapshot()
+    for job in jobs:
+        limit = blocking_limit(snapshot, job.user_id, job.challenge)
+        if limit == GLOBAL_LIMIT:
+            break
+        if limit:
+            continue
+        # the conditional update is the claim, so each job is admitted once
+        if SpawnJob.objects.filter(pk=job.pk, status=SpawnJob.QUEUED).update(status=SpawnJob.PENDING):
+            _count(snapshot, job.user_id, job.challenge)
+            submit_job(job)
+            admitted += 1
+    return admitted
@@ -1,4 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    WAL lets readers keep going while a flag submission writes, and
+    synchronous=NORMAL is durable enough under WAL at a fraction of the fsyncs.
+    """
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
 
 
 class ChallengesConfig(AppConfig):
@@ -6,5 +18,5 @@ class ChallengesConfig(AppConfig):
     name = "challenges"
 
     def ready(self):
-        from .management.commands.cleanup_scheduler import start_cleanup_thread
-        start_cleanup_thread()
+        connection_created.connect(configure_sqlite, dispatch_uid="challenges.configure_sqlite")
+        from . import checks  # noqa: F401
@@ -0,0 +1,546 @@
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import defaultdict
+
+import yaml
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+# set on every container the platform starts (see utils.label_compose)
+PLATFORM_LABEL = "ctf.platform"
+INSTANCE_LABEL = "ctf.instance"
+
+RUNNING = 'running'
+STARTING = 'starting'
+UNHEALTHY = 'unhealthy'
+EXITED = 'exited'
+MISSING = 'missing'
+
+
+def aggregate_state(states):
+    """
+    Collapse per-container (state, health) pairs into one project state.
+    """
+    if not states:
+        return MISSING
+    if any(state != 'running' for state, health in states):
+        return EXITED
+    if any(health == 'unhealthy' for state, health in states):
+        return UNHEALTHY
+    if any(health == 'starting' for state, health in states):
+        return STARTING
+    return RUNNING
+
+
+# container events the platform reacts to; health_status arrives as
+# "health_status: healthy" / "health_status: unhealthy"
+EVENT_ACTIONS = ('start', 'die', 'oom', 'health_status')
+
+
+def parse_event(raw):
+    """
+    Normalise a Docker container event (as decoded from the events API or
+    `docker events --format '{{json .}}'`) into {project, service, action,
+    exit_code}, action being start/die/oom/healthy/unhealthy. Returns None
+    for anything else.
+    """
+    if raw.get("Type", "container") != "container":
+        return None
+    action = raw.get("Action") or raw.get("status") or ""
+    if action.startswith("health_status"):
+        action = action.partition(":")[2].strip()
+        if action not in ('healthy', 'unhealthy'):
+            return None
+    elif action not in EVENT_ACTIONS:
+        return None
+    attributes = (raw.get("Actor") or {}).get("Attributes") or {}
+    project = attributes.get(PROJECT_LABEL)
+    if not project:
+        return None
+    exit_code = attributes.get("exitCode")
+    return {
+        'project': project,
+        'service': attributes.get(SERVICE_LABEL),
+        'action': action,
+        'exit_code': int(exit_code) if exit_code not in (None, "") else None,
+    }
+
+
+class ContainerBackend:
+    """
+    Lifecycle operations for compose projects. `compose` is the parsed
+    (already port-patched) compose model and `base_dir` the challenge folder
+    relative build contexts and bind mounts resolve against.
+    """
+
+    def up(self, project_name, compose, base_dir):
+        raise NotImplementedError
+
+    def down(self, project_name, compose, base_dir):
+        raise NotImplementedError
+
+    def status(self, project_name):
+        """
+        One of running/starting/unhealthy/exited/missing.
+        """
+        raise NotImplementedError
+
+    def list(self, label=PROJECT_LABEL):
+        """
+        {project_name: state} for every compose project the daemon knows
+        about, restricted to containers carrying `label` - one call however
+        many projects there are.
+        """
+        raise NotImplementedError
+
+    def remove_project(self, project_name):
+        """
+        Force-remove whatever the project left behind, found by label, for
+        projects whose compose model is unknown (orphans).
+        """
+        raise NotImplementedError
+
+    def events(self, label=PLATFORM_LABEL):
+        """
+        Blocking iterator over parse_event() dicts for containers carrying
+        `label`. It ends (or raises) when the daemon connection drops.
+        """
+        raise NotImplementedError
+
+    def image_exists(self, tag):
+        raise NotImplementedError
+
+    def image_size(self, tag):
+        """
+        Size of a local image in bytes, or None if it is missing.
+        """
+        raise NotImplementedError
+
+    def build_image(self, context, dockerfile, tag):
+        raise NotImplementedError
+
+    def pull_image(self, tag):
+        raise NotImplementedError
+
+
+class ComposeCLIBackend(ContainerBackend):
+    """
+    Shells out to docker-compose, feeding the compose model on stdin.
+    base_url points the CLI at another daemon (DOCKER_HOST).
+    """
+
+    def __init__(self, base_url=None):
+        self.env = None
+        if base_url:
+            self.env = {**os.environ, "DOCKER_HOST": base_url}
+
+    def _run(self, args, cwd=None, stdin=None, binary="docker-compose"):
+        result = subprocess.run(
+            [binary, *args],
+            cwd=cwd,
+            env=self.env,
+            input=stdin.encode() if stdin is not None else None,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors='replace').strip() or f"{binary} exited with {result.returncode}")
+        return result.stdout.decode(errors='replace')
+
+    def _compose(self, project_name, compose, base_dir, args):
+        return self._run(
+            ["-p", project_name, "--project-directory", base_dir, "-f", "-", *args],
+            cwd=base_dir,
+            stdin=yaml.safe_dump(compose),
+        )
+
+    def up(self, project_name, compose, base_dir):
+        self._compose(project_name, compose, base_dir, ["up", "-d"])
+
+    def down(self, project_name, compose, base_dir):
+        self._compose(project_name, compose, base_dir, ["down"])
+
+    def _ps(self, label_filter):
+        output = self._run(
+            ["ps", "-a", "--filter", f"label={label_filter}",
+             "--format", '{{.Label "%s"}}\t{{.State}}\t{{.Status}}' % PROJECT_LABEL],
+            binary="docker",
+        )
+        projects = defaultdict(list)
+        for line in output.splitlines():
+            project, state, status = line.split("\t")
+            health = None
+            if "(unhealthy)" in status:
+                health = 'unhealthy'
+            elif "(health: starting)" in status:
+                health = 'starting'
+            projects[project].append((state, health))
+        return projects
+
+    def status(self, project_name):
+        return aggregate_state(self._ps(f"{PROJECT_LABEL}={project_name}").get(project_name))
+
+    def list(self, label=PROJECT_LABEL):
+        return {project: aggregate_state(states) for project, states in self._ps(label).items()}
+
+    def remove_project(self, project_name):
+        label = f"label={PROJECT_LABEL}={project_name}"
+        containers = self._run(["ps", "-aq", "--filter", label], binary="docker").split()
+        if containers:
+            self._run(["rm", "-f", "-v", *containers], binary="docker")
+        networks = self._run(["network", "ls", "-q", "--filter", label], binary="docker").split()
+        if networks:
+            self._run(["network", "rm", *networks], binary="docker")
+
+    def events(self, label=PLATFORM_LABEL):
+        args = ["docker", "events", "--format", "{{json .}}", "--filter", "type=container", "--filter", f"label={label}"]
+        for action in EVENT_ACTIONS:
+            args += ["--filter", f"event={action}"]
+        process = subprocess.Popen(args, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            for line in process.stdout:
+                try:
+                    event = parse_event(json.loads(line))
+                except ValueError:
+                    continue
+                if event:
+                    yield event
+        finally:
+            process.kill()
+            process.wait()
+
+    def image_exists(self, tag):
+        try:
+            self._run(["image", "inspect", tag], binary="docker")
+        except RuntimeError:
+            return False
+        return True
+
+    def image_size(self, tag):
+        try:
+            return int(self._run(["image", "inspect", "-f", "{{.Size}}", tag], binary="docker").strip())
+        except (RuntimeError, ValueError):
+            return None
+
+    def build_image(self, context, dockerfile, tag):
+        self._run(["build", "-t", tag, "-f", os.path.join(context, dockerfile), context], binary="docker")
+
+    def pull_image(self, tag):
+        self._run(["pull", tag], binary="docker")
+
+
+class DockerAPIBackend(ContainerBackend):
+    """
+    Talks to the Docker Engine API through one long-lived client, whose HTTP
+    session keeps the daemon connection pooled across calls. Supports the
+    compose subset the challenges use: image/build, ports, environment,
+    command/entrypoint, volumes, restart and depends_on, with every project
+    on its own network where services resolve each other by name.
+    """
+
+    def __init__(self, base_url=None, max_pool_size=10, timeout=120):
+        import docker
+        if base_url:
+            self.client = docker.DockerClient(base_url=base_url, max_pool_size=max_pool_size, timeout=timeout)
+        else:
+            self.client = docker.from_env(max_pool_size=max_pool_size, timeout=timeout)
+        self.api = self.client.api
+
+    def _service_order(self, services):
+        ordered, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            depends = services[name].get("depends_on") or []
+            for dep in (depends.keys() if isinstance(depends, dict) else depends):
+                if dep in services:
+                    visit(dep)
+            ordered.append(name)
+
+        for name in services:
+            visit(name)
+        return ordered
+
+    def _image_for(self, project_name, svc_name, svc, base_dir):
+        from docker.errors import ImageNotFound
+
+        build = svc.get("build")
+        if build:
+            if isinstance(build, str):
+                build = {"context": build}
+            tag = svc.get("image") or f"{project_name}_{svc_name}"
+            self.client.images.build(
+                path=os.path.join(base_dir, build.get("context", ".")),
+                dockerfile=build.get("dockerfile", "Dockerfile"),
+                tag=tag,
+            )
+            return tag
+
+        image = svc["image"]
+        try:
+            self.client.images.get(image)
+        except ImageNotFound:
+            self.client.images.pull(image)
+        return image
+
+    def _port_bindings(self, ports):
+        exposed, bindings = [], {}
+        for p in ports or []:
+            if isinstance(p, dict):
+                key = f"{p['target']}/{p.get('protocol', 'tcp')}"
+                published = p.get("published")
+                host_ip = p.get("host_ip")
+            else:
+                p = str(p)
+                p, _, proto = p.partition("/")
+                parts = p.split(":")
+                key = f"{parts[-1]}/{proto or 'tcp'}"
+                published = parts[-2] if len(parts) >= 2 else None
+                host_ip = parts[0] if len(parts) == 3 else None
+            port, proto = key.split("/")
+            exposed.append((int(port), proto))
+            published = int(published) if published else None
+            bindings[key] = (host_ip, published) if host_ip else published
+        return exposed, bindings
+
+    def _binds(self, project_name, volumes, base_dir):
+        binds = []
+        for v in volumes or []:
+            if isinstance(v, dict):
+                v = f"{v['source']}:{v['target']}" + (":ro" if v.get("read_only") else "")
+            source, _, rest = v.partition(":")
+            if not rest:
+                continue
+            if source.startswith((".", "/", "~")):
+                source = os.path.abspath(os.path.join(base_dir, os.path.expanduser(source)))
+            else:
+                source = f"{project_name}_{source}"
+            binds.append(f"{source}:{rest}")
+        return binds
+
+    def up(self, project_name, compose, base_dir):
+        labels = {PROJECT_LABEL: project_name}
+        network_name = f"{project_name}_default"
+        if not self.api.networks(names=[network_name]):
+            self.api.create_network(network_name, labels=labels)
+
+        services = compose.get("services") or {}
+        for svc_name in self._service_order(services):
+            svc = services[svc_name]
+            container_name = f"{project_name}_{svc_name}_1"
+            if self.api.containers(all=True, filters={"name": f"^{container_name}$"}):
+                self.api.start(container_name)
+                continue
+
+            image = self._image_for(project_name, svc_name, svc, base_dir)
+            exposed, port_bindings = self._port_bindings(svc.get("ports"))
+            restart = svc.get("restart")
+            host_config = self.api.create_host_config(
+                port_bindings=port_bindings,
+                binds=self._binds(project_name, svc.get("volumes"), base_dir),
+                restart_policy={"Name": restart} if restart and restart != "no" else None,
+                network_mode=network_name,
+            )
+            networking_config = self.api.create_networking_config({
+                network_name: self.api.create_endpoint_config(aliases=[svc_name]),
+            })
+            container = self.api.create_container(
+                image,
+                name=container_name,
+                command=svc.get("command"),
+                entrypoint=svc.get("entrypoint"),
+                environment=svc.get("environment"),
+                ports=exposed,
+                labels={**labels, SERVICE_LABEL: svc_name, **(svc.get("labels") or {})},
+                host_config=host_config,
+                networking_config=networking_config,
+            )
+            self.api.start(container["Id"])
+
+    def down(self, project_name, compose, base_dir):
+        self.remove_project(project_name)
+
+    def remove_project(self, project_name):
+        label = f"{PROJECT_LABEL}={project_name}"
+        for container in self.api.containers(all=True, filters={"label": label}):
+            self.api.remove_container(container["Id"], force=True, v=True)
+        for network in self.api.networks(filters={"label": label}):
+            self.api.remove_network(network["Id"])
+
+    def _states(self, filters):
+        projects = defaultdict(list)
+        for container in self.api.containers(all=True, filters=filters):
+            project = container["Labels"].get(PROJECT_LABEL)
+            status = container.get("Status", "")
+            health = 'unhealthy' if "(unhealthy)" in status else 'starting' if "(health: starting)" in status else None
+            projects[project].append((container["State"], health))
+        return projects
+
+    def status(self, project_name):
+        states = self._states({"label": f"{PROJECT_LABEL}={project_name}"})
+        return aggregate_state(states.get(project_name))
+
+    def list(self, label=PROJECT_LABEL):
+        return {project: aggregate_state(states) for project, states in self._states({"label": label}).items()}
+
+    def events(self, label=PLATFORM_LABEL):
+        stream = self.api.events(decode=True, filters={"type": "container", "label": label, "event": list(EVENT_ACTIONS)})
+        try:
+            for raw in stream:
+                event = parse_event(raw)
+                if event:
+                    yield event
+        finally:
+            stream.close()
+
+    def image_exists(self, tag):
+        from docker.errors import ImageNotFound
+        try:
+            self.client.images.get(tag)
+        except ImageNotFound:
+            return False
+        return True
+
+    def image_size(self, tag):
+        from docker.errors import ImageNotFound
+        try:
+            return self.client.images.get(tag).attrs.get("Size")
+        except ImageNotFound:
+            return None
+
+    def build_image(self, context, dockerfile, tag):
+        self.client.images.build(path=context, dockerfile=dockerfile, tag=tag, rm=True)
+
+    def pull_image(self, tag):
+        self.client.images.pull(tag)
+
+
+class FakeBackend(ContainerBackend):
+    """
+    In-memory backend for tests and benchmarks. No Docker required; `delay`
+    simulates how long an up/down takes.
+    """
+
+    def __init__(self, base_url=None, delay=0):
+        self.base_url = base_url
+        self.delay = delay
+        self.projects = {}
+        self.images = set()
+        self.calls = []
+        self.event_queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def up(self, project_name, compose, base_dir):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(('up', project_name))
+            labels = {PROJECT_LABEL}
+            for svc in (compose.get("services") or {}).values():
+                svc_labels = svc.get("labels") or {}
+                labels.update(svc_labels if isinstance(svc_labels, dict) else [l.split("=")[0] for l in svc_labels])
+            self.projects[project_name] = {'state': RUNNING, 'compose': compose, 'base_dir': base_dir, 'labels': labels}
+
+    def down(self, project_name, compose, base_dir):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(('down', project_name))
+            self.projects.pop(project_name, None)
+
+    def remove_project(self, project_name):
+        self.down(project_name, None, None)
+
+    def set_state(self, project_name, state, labels=(PROJECT_LABEL, PLATFORM_LABEL)):
+        """
+        Simulate a project changing state (or appearing) behind our back.
+        """
+        with self._lock:
+            project = self.projects.setdefault(project_name, {'compose': None, 'base_dir': None, 'labels': set(labels)})
+            project['state'] = state
+
+    def status(self, project_name):
+        with self._lock:
+            project = self.projects.get(project_name)
+            return project['state'] if project else MISSING
+
+    def list(self, label=PROJECT_LABEL):
+        with self._lock:
+            return {name: project['state'] for name, project in self.projects.items() if label in project['labels']}
+
+    def emit(self, project_name, action, service='app', exit_code=None):
+        """
+        Feed a raw Docker-style event to events() listeners, e.g.
+        emit(name, 'die', exit_code=137) or emit(name, 'health_status: unhealthy').
+        """
+        attributes = {PROJECT_LABEL: project_name, SERVICE_LABEL: service, PLATFORM_LABEL: "true"}
+        if exit_code is not None:
+            attributes["exitCode"] = str(exit_code)
+        self.event_queue.put({"Type": "container", "Action": action, "Actor": {"Attributes": attributes}})
+
+    def close_events(self):
+        """
+        End the current events() stream, as a dropped connection would.
+        """
+        self.event_queue.put(None)
+
+    def events(self, label=PLATFORM_LABEL):
+        while True:
+            raw = self.event_queue.get()
+            if raw is None:
+                return
+            if label not in raw["Actor"]["Attributes"]:
+                continue
+            event = parse_event(raw)
+            if event:
+                yield event
+
+    def image_exists(self, tag):
+        with self._lock:
+            return tag in self.images
+
+    def image_size(self, tag):
+        with self._lock:
+            return 0 if tag in self.images else None
+
+    def build_image(self, context, dockerfile, tag):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(('build', tag))
+            self.images.add(tag)
+
+    def pull_image(self, tag):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(('pull', tag))
+            self.images.add(tag)
+
+
+_backends = {}
+_backend_lock = threading.Lock()
+
+
+def get_backend(node=None):
+    """
+    The configured backend (CHALLENGE_BACKEND), created once per process and
+    per DockerNode. Without a node it talks to the local/default daemon.
+    """
+    key = node.name if node else None
+    with _backend_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend_class = import_string(getattr(settings, 'CHALLENGE_BACKEND', 'challenges.backends.ComposeCLIBackend'))
+            options = dict(getattr(settings, 'CHALLENGE_BACKEND_OPTIONS', {}))
+            if node:
+                options['base_url'] = node.base_url
+            backend = _backends[key] = backend_class(**options)
+    return backend
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+
+from .models import ActiveContainer, CTFChallenge, CompletedChallenge
+
+FACETS_KEY = "challenges:facets"
+
+
+def catalog_challenges():
+    """
+    The catalog as everyone sees it, in one query: every row carries its
+    solve count (the denormalised counter) and the first-blood username.
+    """
+    first_blood = (
+        CompletedChallenge.objects.filter(challenge=OuterRef('pk'))
+        .order_by('completed_at', 'id')
+        .values('user__username')[:1]
+    )
+    return CTFChallenge.objects.annotate(first_blood=Subquery(first_blood)).order_by('id')
+
+
+def user_overlay(user):
+    """
+    What the catalog shows differently for `user`: the ids of the
+    challenges they solved and of those they have an instance of up.
+    """
+    return {
+        'solved': set(CompletedChallenge.objects.filter(user=user).values_list('challenge_id', flat=True)),
+        'running': set(
+            ActiveContainer.objects.filter(
+                user=user, status__in=[ActiveContainer.STARTING, ActiveContainer.READY]
+            ).values_list('challenge_id', flat=True)
+        ),
+    }
+
+
+def facets():
+    """
+    Filter options with how many challenges each has, from one grouped
+    query per facet, cached until a challenge is saved or deleted.
+    """
+    result = cache.get(FACETS_KEY)
+    if result is None:
+        labels = dict(CTFChallenge.DIFFICULTY_LEVELS)
+        result = {
+            'difficulties': [
+                (row['difficulty'], labels.get(row['difficulty'], row['difficulty']), row['n'])
+                for row in CTFChallenge.objects.values('difficulty').annotate(n=Count('id')).order_by('difficulty')
+            ],
+            'types': [
+                (row['type'], row['n'])
+                for row in CTFChallenge.objects.values('type').annotate(n=Count('id')).order_by('type')
+            ],
+        }
+        cache.set(FACETS_KEY, result, getattr(settings, 'CHALLENGE_FACETS_TTL', 300))
+    return result
+
+
+def invalidate_facets():
+    cache.delete(FACETS_KEY)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The scheduler, the event watcher and every web worker exchange state
+    through the default cache, so it has to be one they all see. Setups that
+    really run in one process (the test runner) set CHALLENGE_SINGLE_PROCESS.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES and not getattr(settings, 'CHALLENGE_SINGLE_PROCESS', False):
+        return [Error(
+            f"CACHES['default'] uses {backend}, which each process keeps to itself.",
+            hint="Use a cache shared between processes (Redis, Memcached, the database or the file cache); "
+                 "instance states, page fragments and the scoreboard are written by one process and read by others.",
+            id='challenges.E001',
+        )]
+    return []
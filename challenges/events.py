@@ -0,0 +1,147 @@
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .backends import get_backend, RUNNING, UNHEALTHY, EXITED, MISSING
+from .jobs import get_executor, stop_isolated_instance
+from .models import ActiveContainer, CTFChallenge, DockerNode, WarmInstance
+from .ports import release_ports
+from .snapshot import set_container_state
+
+logger = logging.getLogger(__name__)
+
+SHARED_PROJECT_RE = re.compile(r"^shared_ch(\d+)$")
+
+# project state each event implies; die/oom are confirmed with status() first
+EVENT_STATES = {
+    'start': RUNNING,
+    'healthy': RUNNING,
+    'unhealthy': UNHEALTHY,
+    'die': EXITED,
+    'oom': EXITED,
+}
+
+
+def _teardown(row):
+    close_old_connections()
+    try:
+        stop_isolated_instance(row.challenge, row.project_name, row.host_port, row.compose_temp_path, row.node)
+    except Exception:
+        logger.exception("Failed to clean up crashed instance %s", row.project_name)
+    finally:
+        close_old_connections()
+
+
+def _handle_exit(project_name, node, reason):
+    """
+    A container of the project died. If the project is really down (a
+    restart policy may already have brought it back), drop its row, free its
+    ports at once and remove the leftovers in the background.
+    """
+    rows = [
+        row
+        for model in (ActiveContainer, WarmInstance)
+        for row in model.objects.filter(project_name=project_name).select_related('challenge', 'node')
+    ]
+    if not rows:
+        # our own stop/reap already removed it, or it is not an instance
+        return
+
+    state = get_backend(node).status(project_name)
+    set_container_state(project_name, state)
+    if state not in (EXITED, MISSING):
+        return
+
+    for row in rows:
+        # deleting the row is the claim, so a concurrent stop or reap cannot double up
+        deleted, _ = type(row).objects.filter(pk=row.pk).delete()
+        if not deleted:
+            continue
+        release_ports(project_name)
+        get_executor().submit(_teardown, row)
+        logger.warning("Instance %s %s; removed it and freed its ports", project_name, reason)
+        if isinstance(row, WarmInstance):
+            from .pool import schedule_refill
+            schedule_refill(row.challenge)
+
+
+def handle_event(event, node=None):
+    """
+    Apply one parse_event() dict: update the cached state, mark instances
+    ready on a healthy report and clean up crashed or OOM-killed ones.
+    """
+    project_name = event['project']
+    action = event['action']
+    state = EVENT_STATES[action]
+    set_container_state(project_name, state)
+
+    shared = SHARED_PROJECT_RE.match(project_name)
+    if shared:
+        from .shared import set_shared_state
+        challenge = CTFChallenge.objects.filter(pk=int(shared.group(1))).first()
+        if challenge:
+            set_shared_state(challenge, state)
+        return
+
+    if action == 'healthy':
+        ActiveContainer.objects.filter(project_name=project_name, status=ActiveContainer.STARTING).update(
+            status=ActiveContainer.READY, ready_at=timezone.now()
+        )
+    elif action == 'oom':
+        _handle_exit(project_name, node, "was OOM-killed")
+    elif action == 'die':
+        exit_code = event['exit_code']
+        _handle_exit(project_name, node, f"exited with code {exit_code}" if exit_code is not None else "exited")
+
+
+def listen(node=None, stop=None):
+    """
+    Follow the node's event stream until `stop` (a threading.Event) is set.
+    When the stream drops, the node is reconciled (events may have been
+    missed) and the stream reopened with exponential backoff.
+    """
+    from .reconcile import reconcile_node
+
+    stop = stop or threading.Event()
+    max_backoff = getattr(settings, 'CHALLENGE_EVENTS_MAX_BACKOFF', 30)
+    backoff = 1
+    while not stop.is_set():
+        try:
+            for event in get_backend(node).events():
+                close_old_connections()
+                try:
+                    handle_event(event, node)
+                except Exception:
+                    logger.exception("Failed to handle %s event for %s", event['action'], event['project'])
+                backoff = 1
+                if stop.is_set():
+                    break
+        except Exception as e:
+            logger.warning("Event stream from %s dropped: %s", node or 'default', e)
+        if stop.wait(backoff):
+            break
+        backoff = min(backoff * 2, max_backoff)
+        try:
+            reconcile_node(node)
+        except Exception:
+            logger.exception("Failed to reconcile %s", node or 'default')
+    close_old_connections()
+
+
+def start_listeners(stop=None):
+    """
+    One listener thread per daemon (the default one plus every active node).
+    Returns the threads.
+    """
+    threads = []
+    for node in [None, *DockerNode.objects.filter(is_active=True)]:
+        thread = threading.Thread(
+            target=listen, args=(node, stop), name=f"challenge-events-{node or 'default'}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
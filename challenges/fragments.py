@@ -0,0 +1,115 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Version counters: every cached fragment's key includes the versions of
+# what it shows, so bumping one retires exactly the fragments built from it
+# (they are never deleted, just no longer looked up, and expire on their own).
+CATALOG = 'catalog'      # which challenges exist and their order (edit, add, delete)
+CHALLENGE = 'challenge'  # one challenge's row and page (edit, solve)
+USER = 'user'            # one player's solves and instances (solve, start, stop)
+
+# fragment names whose hit/miss counters `manage.py fragment_stats` reports
+FRAGMENTS = ('catalog_page', 'catalog', 'catalog_overlay', 'challenge')
+
+
+def _version_key(scope, ident=None):
+    return f"frag:v:{scope}" if ident is None else f"frag:v:{scope}:{ident}"
+
+
+def _stat_key(name, outcome):
+    return f"frag:stats:{name}:{outcome}"
+
+
+def _ttl():
+    return getattr(settings, 'CHALLENGE_FRAGMENT_TTL', 600)
+
+
+def versions(*scopes):
+    """
+    Current version of each (scope, ident) pair, in order, from one cache
+    read. A version the cache lost restarts from the clock rather than 0,
+    so it never matches a fragment built before it was lost.
+    """
+    keys = [_version_key(*scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def bump(*scopes):
+    """
+    Retire the fragments built from these (scope, ident) pairs. Inside a
+    transaction the bump waits for the commit, so a page rendered in
+    between cannot cache the old data under the new version.
+    """
+    keys = [_version_key(*scope) for scope in scopes]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def fragment_key(name, parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f"frag:{name}:{digest}"
+
+
+def _count(name, outcome):
+    key = _stat_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_fragment(name, parts):
+    html = cache.get(fragment_key(name, parts))
+    _count(name, 'miss' if html is None else 'hit')
+    return html
+
+
+def set_fragment(name, parts, html):
+    cache.set(fragment_key(name, parts), html, _ttl())
+
+
+def cached(name, parts, build):
+    """
+    cache.get-or-set for a non-template value (e.g. a page's row ids) under
+    the same versioned keys and counters as the fragments.
+    """
+    value = get_fragment(name, parts)
+    if value is None:
+        value = build()
+        set_fragment(name, parts, value)
+    return value
+
+
+def stats():
+    """
+    {fragment name: (hits, misses, hit ratio or None)} since the counters
+    were last reset.
+    """
+    found = cache.get_many([_stat_key(name, outcome) for name in FRAGMENTS for outcome in ('hit', 'miss')])
+    result = {}
+    for name in FRAGMENTS:
+        hits = found.get(_stat_key(name, 'hit'), 0)
+        misses = found.get(_stat_key(name, 'miss'), 0)
+        result[name] = (hits, misses, hits / (hits + misses) if hits + misses else None)
+    return result
+
+
+def reset_stats():
+    cache.delete_many([_stat_key(name, outcome) for name in FRAGMENTS for outcome in ('hit', 'miss')])
@@ -0,0 +1,167 @@
+import fnmatch
+import hashlib
+import os
+import threading
+
+from django.utils.text import slugify
+
+from .backends import get_backend
+
+# context dir -> (file signature, content hash); rehashing only when files change
+_hash_cache = {}
+# (node name, tag) pairs known to exist, so repeat spawns skip the daemon check
+_known_images = set()
+# one lock per (node name, tag) so concurrent spawns wait for a single build
+_build_locks = {}
+_lock = threading.Lock()
+
+
+def _dockerignore_patterns(context_dir):
+    path = os.path.join(context_dir, ".dockerignore")
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def _context_files(context_dir):
+    ignore = _dockerignore_patterns(context_dir)
+    files = []
+    for root, dirs, names in os.walk(context_dir):
+        dirs.sort()
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, context_dir).replace(os.sep, "/")
+            if rel.startswith("docker-compose.temp_"):
+                continue
+            if any(fnmatch.fnmatch(rel, pattern) or rel.startswith(pattern.rstrip("/") + "/") for pattern in ignore):
+                continue
+            files.append((rel, full))
+    return files
+
+
+def context_hash(context_dir, dockerfile="Dockerfile"):
+    """
+    Content hash of a build context: every file's path and bytes (minus
+    .dockerignore'd ones) plus the Dockerfile name. Cached until a file's
+    mtime or size changes, so a spawn only pays for an os.walk.
+    """
+    context_dir = os.path.abspath(context_dir)
+    files = _context_files(context_dir)
+    stats = [(rel, os.stat(full)) for rel, full in files]
+    signature = (dockerfile, tuple((rel, st.st_mtime_ns, st.st_size) for rel, st in stats))
+
+    with _lock:
+        cached = _hash_cache.get(context_dir)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256(dockerfile.encode())
+    for rel, full in files:
+        digest.update(rel.encode() + b"\0")
+        with open(full, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    digest = digest.hexdigest()
+
+    with _lock:
+        _hash_cache[context_dir] = (signature, digest)
+    return digest
+
+
+def _build_spec(svc, base_dir):
+    build = svc["build"]
+    if isinstance(build, str):
+        build = {"context": build}
+    return os.path.join(base_dir, build.get("context", ".")), build.get("dockerfile", "Dockerfile")
+
+
+def image_tag(base_dir, svc_name, digest):
+    """
+    Content-addressed tag for a service built from the challenge folder,
+    e.g. ctf/captcha1-php:<hash>. Every challenge pointing at the same folder
+    shares it, and the spawn path and build_images agree without the DB.
+    """
+    return f"ctf/{slugify(os.path.basename(os.path.abspath(base_dir)))}-{slugify(svc_name)}:{digest[:16]}"
+
+
+def build_targets(compose, base_dir):
+    """
+    [(service name, context dir, dockerfile, tag)] for every service the
+    compose file builds from source.
+    """
+    targets = []
+    for svc_name, svc in (compose.get("services") or {}).items():
+        if not svc.get("build"):
+            continue
+        context, dockerfile = _build_spec(svc, base_dir)
+        targets.append((svc_name, context, dockerfile, image_tag(base_dir, svc_name, context_hash(context, dockerfile))))
+    return targets
+
+
+def ensure_image(context, dockerfile, tag, node=None):
+    """
+    Build `tag` on the node unless it already exists there. Returns True if
+    a build actually ran.
+    """
+    key = (node.name if node else '', tag)
+    if key in _known_images:
+        return False
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        if key in _known_images:
+            return False
+        backend = get_backend(node)
+        built = False
+        if not backend.image_exists(tag):
+            backend.build_image(context, dockerfile, tag)
+            built = True
+        _known_images.add(key)
+        return built
+
+
+def use_prebuilt_images(compose, base_dir, node=None):
+    """
+    Return a copy of the compose model where every `build:` service points at
+    the challenge's content-addressed image instead, building it first if
+    this node does not have it yet. Isolated projects then never build.
+    """
+    targets = build_targets(compose, base_dir)
+    if not targets:
+        return compose
+
+    compose = dict(compose)
+    services = dict(compose["services"])
+    compose["services"] = services
+    for svc_name, context, dockerfile, tag in targets:
+        ensure_image(context, dockerfile, tag, node)
+        svc = {key: value for key, value in services[svc_name].items() if key != "build"}
+        svc["image"] = tag
+        services[svc_name] = svc
+    return compose
+
+
+def discover_images(directories):
+    """
+    Everything the challenges in `directories` need on a node: a build task
+    per `build:` service (or per bare Dockerfile) and a pull task per plain
+    `image:` service. Returns de-duplicated dicts with kind/tag/context/dockerfile.
+    """
+    from .utils import load_compose
+
+    tasks = {}
+    for base_dir in directories:
+        compose_file = os.path.join(base_dir, "docker-compose.yml")
+        if os.path.isfile(compose_file):
+            compose = load_compose(compose_file)
+            for svc_name, context, dockerfile, tag in build_targets(compose, base_dir):
+                tasks[tag] = {'kind': 'build', 'tag': tag, 'context': context, 'dockerfile': dockerfile}
+            for svc in (compose.get("services") or {}).values():
+                if svc.get("image") and not svc.get("build"):
+                    tasks.setdefault(svc["image"], {'kind': 'pull', 'tag': svc["image"], 'context': None, 'dockerfile': None})
+        elif os.path.isfile(os.path.join(base_dir, "Dockerfile")):
+            tag = image_tag(base_dir, "app", context_hash(base_dir))
+            tasks[tag] = {'kind': 'build', 'tag': tag, 'context': base_dir, 'dockerfile': "Dockerfile"}
+    return list(tasks.values())
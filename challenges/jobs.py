@@ -0,0 +1,290 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .backends import get_backend, RUNNING, MISSING
+from .images import use_prebuilt_images
+from .models import ActiveContainer, SpawnJob
+from .placement import place_instance
+from .ports import release_ports
+from .scheduler import acquire_lease, default_holder, release_lease
+from .utils import generate_project_name, shared_project_name, load_compose, compose_with_port, label_compose
+
+_executor = None
+_executor_lock = threading.Lock()
+
+SLOT_LEASE = 'compose-slot'
+
+
+def _stale_after():
+    return getattr(settings, 'CHALLENGE_JOB_STALE_AFTER', 900)
+
+
+def _pending_stale_after():
+    return getattr(settings, 'CHALLENGE_JOB_PENDING_STALE_AFTER', 30)
+
+
+@contextmanager
+def compose_slot(node=None):
+    """
+    Hold one of the node's CHALLENGE_JOB_CONCURRENCY compose slots while
+    starting or stopping a project, waiting until one is free. Slots are
+    leases in the database, so the limit holds per Docker daemon across
+    every web worker, the scheduler and the event watcher; a slot whose
+    holder died frees itself after CHALLENGE_JOB_STALE_AFTER seconds.
+    """
+    holder = f"{default_holder()}:{uuid.uuid4().hex[:8]}"
+    slots = [
+        f"{SLOT_LEASE}:{node.pk if node else 'default'}:{i}"
+        for i in range(getattr(settings, 'CHALLENGE_JOB_CONCURRENCY', 4))
+    ]
+    name = None
+    while name is None:
+        name = next((slot for slot in slots if acquire_lease(holder, _stale_after(), slot)), None)
+        if name is None:
+            time.sleep(getattr(settings, 'CHALLENGE_JOB_SLOT_POLL', 0.5))
+    try:
+        yield
+    finally:
+        release_lease(holder, name)
+
+
+def get_executor():
+    """
+    Process-wide worker pool for spawn/stop jobs, pool refills and
+    teardowns. How many compose runs hit a daemon at once is capped
+    separately, across processes, by compose_slot().
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CHALLENGE_JOB_CONCURRENCY', 4),
+                thread_name_prefix='challenge-job',
+            )
+    return _executor
+
+
+def enqueue_job(user, challenge, action):
+    """
+    Queue a spawn/stop job and return it. An unfinished job for the same
+    user, challenge and action is reused instead of queueing a duplicate;
+    for shared challenges any user's unfinished job is reused, so concurrent
+    starters of one shared stack all wait on a single job.
+    Isolated spawns go through admission control (challenges.admission) and
+    may stay queued until capacity frees up; raises AdmissionQueueFull when
+    the wait queue is full.
+    """
+    from .admission import check_queue_space, dispatch_queue
+
+    unfinished = SpawnJob.objects.filter(
+        challenge=challenge,
+        action=action,
+        status__in=SpawnJob.UNFINISHED,
+    )
+    if challenge.is_isolated:
+        unfinished = unfinished.filter(user=user)
+    job = unfinished.first()
+    if job:
+        return job
+
+    if action == SpawnJob.SPAWN and challenge.is_isolated:
+        check_queue_space()
+        job = SpawnJob.objects.create(user=user, challenge=challenge, action=action, status=SpawnJob.QUEUED)
+        dispatch_queue()
+        job.refresh_from_db()
+        return job
+
+    job = SpawnJob.objects.create(user=user, challenge=challenge, action=action)
+    submit_job(job)
+    return job
+
+
+def submit_job(job):
+    """
+    Hand an admitted job to the worker pool once the current transaction commits.
+    """
+    transaction.on_commit(lambda: get_executor().submit(run_job, job.id))
+
+
+def run_job(job_id):
+    """
+    Worker entry point: execute a queued job and record its outcome.
+    """
+    close_old_connections()
+    try:
+        # the conditional update is the claim: a job resubmitted by
+        # recover_stale_jobs() while the first copy is still queued runs once
+        claimed = SpawnJob.objects.filter(pk=job_id, status=SpawnJob.PENDING).update(
+            status=SpawnJob.STARTING, updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = SpawnJob.objects.select_related('user', 'challenge').get(pk=job_id)
+
+        try:
+            if job.action == SpawnJob.SPAWN:
+                spawn_environment(job.user, job.challenge)
+            else:
+                stop_environment(job.user, job.challenge)
+        except Exception as e:
+            job.status = SpawnJob.FAILED
+            job.error = str(e)
+        else:
+            job.status = SpawnJob.READY
+        job.save(update_fields=['status', 'error', 'updated_at'])
+
+        if job.action == SpawnJob.STOP and job.challenge.is_isolated:
+            # a slot was freed; let the next queued spawn in
+            from .admission import dispatch_queue
+            dispatch_queue()
+    finally:
+        close_old_connections()
+
+
+def recover_stale_jobs():
+    """
+    Scheduler task for jobs whose process went away (restart, crash): a job
+    still pending after CHALLENGE_JOB_PENDING_STALE_AFTER seconds may have
+    been lost from its worker pool's queue and is resubmitted here (the
+    claim in run_job keeps it from running twice); one still starting after
+    CHALLENGE_JOB_STALE_AFTER died mid-compose and is failed, so the user
+    can retry and admission stops counting it. Returns (resubmitted, failed).
+    """
+    now = timezone.now()
+    failed = SpawnJob.objects.filter(
+        status=SpawnJob.STARTING, updated_at__lt=now - timedelta(seconds=_stale_after())
+    ).update(status=SpawnJob.FAILED, error="The worker running this job stopped. Try again.", updated_at=now)
+    resubmitted = 0
+    pending_cutoff = now - timedelta(seconds=_pending_stale_after())
+    for job in SpawnJob.objects.filter(status=SpawnJob.PENDING, updated_at__lt=pending_cutoff):
+        # touching updated_at is the claim, so only one scheduler resubmits it
+        if SpawnJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(updated_at=timezone.now()):
+            submit_job(job)
+            resubmitted += 1
+    return resubmitted, failed
+
+
+def _compose_file(challenge):
+    base_dir = os.path.abspath(challenge.compose_path)
+    return base_dir, os.path.join(base_dir, "docker-compose.yml")
+
+
+def start_isolated_instance(challenge, project_name):
+    """
+    Start one isolated copy of the challenge on the least-loaded node, on a
+    freshly leased host port. Returns (host_port, node); node is None for
+    the default daemon.
+    """
+    base_dir, compose_file = _compose_file(challenge)
+    host_port, node = place_instance(challenge, project_name)
+    try:
+        compose, modified = compose_with_port(compose_file, challenge.internal_port, host_port)
+        compose = use_prebuilt_images(compose, base_dir, node)
+        with compose_slot(node):
+            get_backend(node).up(project_name, label_compose(compose, project_name), base_dir)
+    except Exception:
+        release_ports(project_name)
+        raise
+    return host_port, node
+
+
+def stop_isolated_instance(challenge, project_name, host_port, compose_temp_path=None, node=None):
+    """
+    Tear down one isolated instance and release its port lease.
+    compose_temp_path is only set for instances started before compose files
+    were rendered in memory; such files are used and then removed.
+    """
+    base_dir, compose_file = _compose_file(challenge)
+    try:
+        if compose_temp_path and os.path.exists(compose_temp_path):
+            compose = load_compose(compose_temp_path)
+        else:
+            compose, modified = compose_with_port(compose_file, challenge.internal_port, host_port)
+        with compose_slot(node):
+            get_backend(node).down(project_name, compose, base_dir)
+    finally:
+        release_ports(project_name)
+        try:
+            if compose_temp_path and os.path.exists(compose_temp_path):
+                os.remove(compose_temp_path)
+        except Exception:
+            pass
+
+
+def spawn_environment(user, challenge):
+    """
+    Bring up the shared stack, or a per-user instance for isolated challenges.
+    Isolated spawns take a pre-started instance from the warm pool when one is idle.
+    """
+    from .pool import claim_warm_instance, schedule_refill
+    from .shared import extend_shared_deadline, get_shared_state, set_shared_state, UP_STATES
+
+    if not challenge.is_isolated:
+        if get_shared_state(challenge, refresh=True) in UP_STATES:
+            extend_shared_deadline(challenge)
+            return
+        base_dir, compose_file = _compose_file(challenge)
+        project_name = shared_project_name(challenge)
+        with compose_slot():
+            get_backend().up(project_name, label_compose(load_compose(compose_file), project_name), base_dir)
+        set_shared_state(challenge, RUNNING)
+        challenge.last_launched = timezone.now()
+        challenge.shared_expires_at = challenge.instance_deadline(challenge.last_launched)
+        challenge.save(update_fields=['last_launched', 'shared_expires_at'])
+        return
+
+    if ActiveContainer.objects.filter(user=user, challenge=challenge).exists():
+        return
+
+    if claim_warm_instance(user, challenge):
+        return
+
+    project_name = generate_project_name(user, challenge)
+    host_port, node = start_isolated_instance(challenge, project_name)
+
+    ActiveContainer.objects.create(
+        user=user,
+        challenge=challenge,
+        project_name=project_name,
+        host_port=host_port,
+        node=node,
+        expires_at=challenge.instance_deadline(),
+    )
+    schedule_refill(challenge)
+
+
+def stop_environment(user, challenge):
+    """
+    Tear down the shared stack, or the user's isolated instance.
+    """
+    from .shared import set_shared_state
+    if not challenge.is_isolated:
+        base_dir, compose_file = _compose_file(challenge)
+        with compose_slot():
+            get_backend().down(shared_project_name(challenge), load_compose(compose_file), base_dir)
+        set_shared_state(challenge, MISSING)
+        challenge.last_launched = None
+        challenge.shared_expires_at = None
+        challenge.save(update_fields=['last_launched', 'shared_expires_at'])
+        return
+
+    existing = ActiveContainer.objects.filter(user=user, challenge=challenge).first()
+    if not existing:
+        return
+
+    try:
+        stop_isolated_instance(
+            challenge, existing.project_name, existing.host_port, existing.compose_temp_path, existing.node
+        )
+    finally:
+        # remove the DB record even if compose failed
+        existing.delete()
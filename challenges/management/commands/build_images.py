@@ -1,18 +1,76 @@
-import os, docker
-from django.core.management.base import BaseCommand
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from challenges.models import CTFChallenge
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.backends import get_backend
+from challenges.images import discover_images
+from challenges.models import CTFChallenge, DockerNode
 
 
 class Command(BaseCommand):
-    help = "Build Docker images for all challenges"
+    help = "Build (and pull) the Docker images for every challenge, skipping unchanged build contexts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=getattr(settings, "CHALLENGE_BUILD_CONCURRENCY", 4),
+                            help="Images built in parallel")
+        parser.add_argument("--node", help="DockerNode to prepare (default: the local daemon)")
+        parser.add_argument("--force", action="store_true", help="Rebuild even if the tag already exists")
+        parser.add_argument("--no-pull", action="store_true", help="Skip pulling plain image: services")
+
+    def _directories(self):
+        root = getattr(settings, "CHALLENGE_CONTAINERS_DIR", os.path.join(settings.BASE_DIR, "containers"))
+        directories = {
+            os.path.join(root, name) for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))
+        } if os.path.isdir(root) else set()
+        for compose_path in CTFChallenge.objects.exclude(compose_path__isnull=True).exclude(compose_path="") \
+                .values_list("compose_path", flat=True):
+            directories.add(os.path.abspath(compose_path))
+        return sorted(directories)
+
+    def _prepare(self, backend, task, force):
+        if not force and backend.image_exists(task["tag"]):
+            return "up to date", 0.0, backend.image_size(task["tag"])
+        started = time.monotonic()
+        if task["kind"] == "build":
+            backend.build_image(task["context"], task["dockerfile"], task["tag"])
+            verb = "built"
+        else:
+            backend.pull_image(task["tag"])
+            verb = "pulled"
+        return verb, time.monotonic() - started, backend.image_size(task["tag"])
 
     def handle(self, *args, **opts):
-        client = docker.from_env()
-        base_path = os.path.abspath(os.path.join(os.getcwd(), "..", "CTF\containers"))
-
-        for challenge in CTFChallenge.objects.all() and challenge.title == "":
-            path = os.path.join(base_path, challenge.docker_image)
-            self.stdout.write(f"Building image for {challenge.title} from {path}")
-            image, _ = client.images.build(path=path, tag=challenge.docker_image)
-            self.stdout.write(self.style.SUCCESS(f"Built {challenge.docker_image}"))
+        node = None
+        if opts["node"]:
+            try:
+                node = DockerNode.objects.get(name=opts["node"])
+            except DockerNode.DoesNotExist:
+                raise CommandError(f"Unknown node: {opts['node']}")
+        backend = get_backend(node)
+
+        tasks = discover_images(self._directories())
+        if opts["no_pull"]:
+            tasks = [task for task in tasks if task["kind"] == "build"]
+        self.stdout.write(f"Preparing {len(tasks)} image(s) with {opts['jobs']} worker(s)")
+
+        failures = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(opts["jobs"], 1)) as pool:
+            futures = {pool.submit(self._prepare, backend, task, opts["force"]): task for task in tasks}
+            for future in as_completed(futures):
+                tag = futures[future]["tag"]
+                try:
+                    verb, seconds, size = future.result()
+                except Exception as e:
+                    failures += 1
+                    self.stderr.write(self.style.ERROR(f"{tag}: failed: {e}"))
+                    continue
+                size = f"{size / (1024 * 1024):.1f} MB" if size is not None else "size unknown"
+                self.stdout.write(self.style.SUCCESS(f"{tag}: {verb} in {seconds:.1f}s ({size})"))
+
+        self.stdout.write(f"Done in {time.monotonic() - started:.1f}s, {failures} failure(s)")
+        if failures:
+            raise CommandError(f"{failures} image(s) failed")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from challenges.fragments import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counts and hit ratio of the cached challenge page fragments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters after printing them")
+
+    def handle(self, *args, **opts):
+        for name, (hits, misses, ratio) in stats().items():
+            shown = f"{ratio:.1%}" if ratio is not None else "-"
+            self.stdout.write(f"{name:<16} hits={hits:<8} misses={misses:<8} ratio={shown}")
+        if opts["reset"]:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
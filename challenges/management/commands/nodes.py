@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.jobs import stop_isolated_instance
+from challenges.models import DockerNode, WarmInstance
+from challenges.placement import cluster_summary
+
+
+class Command(BaseCommand):
+    help = "Show per-node load, or drain/undrain a Docker node"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drain", metavar="NODE", help="Stop placing instances on NODE and stop its idle warm instances")
+        parser.add_argument("--undrain", metavar="NODE", help="Allow placements on NODE again")
+
+    def _node(self, name):
+        try:
+            return DockerNode.objects.get(name=name)
+        except DockerNode.DoesNotExist:
+            raise CommandError(f"Unknown node: {name}")
+
+    def handle(self, *args, **opts):
+        if opts["drain"]:
+            node = self._node(opts["drain"])
+            node.is_draining = True
+            node.save(update_fields=["is_draining"])
+            for warm in WarmInstance.objects.filter(node=node).select_related("challenge"):
+                deleted, _ = WarmInstance.objects.filter(pk=warm.pk).delete()
+                if deleted:
+                    stop_isolated_instance(warm.challenge, warm.project_name, warm.host_port, warm.compose_temp_path, node)
+            self.stdout.write(self.style.SUCCESS(f"{node} is draining"))
+
+        if opts["undrain"]:
+            node = self._node(opts["undrain"])
+            node.is_draining = False
+            node.save(update_fields=["is_draining"])
+            self.stdout.write(self.style.SUCCESS(f"{node} accepts new instances"))
+
+        for name, load in cluster_summary().items():
+            flags = " (draining)" if load["draining"] else "" if load["active"] else " (inactive)"
+            self.stdout.write(
+                f"{name}{flags}: {load['instances']}/{load['max_instances'] or '-'} instances, "
+                f"{load['memory_mb']}/{load['memory_capacity_mb'] or '-'} MB reserved, "
+                f"{load['free_ports']} free ports"
+            )
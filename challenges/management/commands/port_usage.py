@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from challenges.models import DockerNode
+from challenges.ports import port_usage
+
+
+class Command(BaseCommand):
+    help = "Show how many host ports are leased to challenge instances"
+
+    def handle(self, *args, **opts):
+        for node in [None, *DockerNode.objects.all()]:
+            usage = port_usage(node)
+            start, end = usage["range"]
+            self.stdout.write(
+                f"{node or 'default'}: ports {start}-{end}: {usage['in_use']} in use, "
+                f"{usage['free']} free of {usage['capacity']}"
+            )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from challenges.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    help = "Sync instance rows with the containers the Docker daemons actually run"
+
+    def handle(self, *args, **opts):
+        counts = reconcile()
+        self.stdout.write(
+            f"Removed {counts['ghosts']} stale rows, {counts['exited']} exited instances "
+            f"and {counts['orphans']} orphaned projects"
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from challenges.scheduler import run_scheduler
+
+
+class Command(BaseCommand):
+    help = "Run the background scheduler (reaper, warm pools, ...); only the lease holder does work"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run a single scheduler tick and exit")
+        parser.add_argument("--holder", help="Lease holder id (defaults to hostname:pid)")
+
+    def handle(self, *args, **opts):
+        try:
+            run_scheduler(holder=opts["holder"], once=opts["once"], log=self.stdout.write)
+        except KeyboardInterrupt:
+            self.stdout.write("Scheduler stopped")
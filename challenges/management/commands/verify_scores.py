@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from challenges.scoring import verify
+
+
+class Command(BaseCommand):
+    help = "Recompute solve counts, challenge values and scores from scratch and diff them against the stored ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Write the recomputed values back")
+
+    def handle(self, *args, **opts):
+        differences = verify(fix=opts["fix"])
+        for line in differences:
+            self.stdout.write(line)
+        if not differences:
+            self.stdout.write(self.style.SUCCESS("Stored scores match a full recomputation"))
+        elif opts["fix"]:
+            self.stdout.write(self.style.WARNING(f"Fixed {len(differences)} differences"))
+        else:
+            self.stdout.write(self.style.ERROR(f"{len(differences)} differences; run with --fix to repair"))
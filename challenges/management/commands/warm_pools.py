@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from challenges.pool import fill_all_pools
+
+
+class Command(BaseCommand):
+    help = "Start idle instances for every isolated challenge's warm pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prewarm", action="store_true",
+            help="Fill pools up to warm_pool_max instead of warm_pool_min",
+        )
+
+    def handle(self, *args, **opts):
+        for title, started in fill_all_pools(prewarm=opts["prewarm"]).items():
+            self.stdout.write(f"{title}: started {started} instance(s)")
+        self.stdout.write(self.style.SUCCESS("Warm pools filled"))
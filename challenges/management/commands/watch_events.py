@@ -0,0 +1,21 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from challenges.events import start_listeners
+
+
+class Command(BaseCommand):
+    help = "Follow the Docker event streams and update instance state as containers start, die or change health"
+
+    def handle(self, *args, **opts):
+        stop = threading.Event()
+        threads = start_listeners(stop)
+        self.stdout.write(f"Watching {len(threads)} Docker daemon(s) for container events")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write("Event watcher stopped")
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0024_spawnjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="warm_pool_max",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Upper bound on idle pre-started instances; pre-warming fills up to this",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="warm_pool_min",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Idle pre-started instances to keep ready (isolated challenges only)",
+            ),
+        ),
+        migrations.CreateModel(
+            name="WarmInstance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("project_name", models.CharField(max_length=150, unique=True)),
+                ("host_port", models.IntegerField()),
+                (
+                    "compose_temp_path",
+                    models.CharField(blank=True, max_length=1024, null=True),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "challenge",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="warm_instances",
+                        to="challenges.ctfchallenge",
+                    ),
+                ),
+            ],
+        ),
+    ]
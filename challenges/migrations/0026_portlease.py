@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:47
+
+from django.db import migrations, models
+
+
+def lease_existing_ports(apps, schema_editor):
+    PortLease = apps.get_model("challenges", "PortLease")
+    ActiveContainer = apps.get_model("challenges", "ActiveContainer")
+    WarmInstance = apps.get_model("challenges", "WarmInstance")
+    for model in (ActiveContainer, WarmInstance):
+        for project_name, port in model.objects.values_list("project_name", "host_port"):
+            PortLease.objects.get_or_create(port=port, defaults={"project_name": project_name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0025_ctfchallenge_warm_pool_max_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PortLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("port", models.IntegerField(unique=True)),
+                ("project_name", models.CharField(db_index=True, max_length=150)),
+                ("leased_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(lease_existing_ports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:50
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_existing_deadlines(apps, schema_editor):
+    ActiveContainer = apps.get_model("challenges", "ActiveContainer")
+    ttl = timedelta(seconds=getattr(settings, "CHALLENGE_INSTANCE_TTL", 30 * 60))
+    for active in ActiveContainer.objects.filter(expires_at__isnull=True):
+        active.expires_at = active.started_at + ttl
+        active.save(update_fields=["expires_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0026_portlease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activecontainer",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="instance_ttl",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Seconds an instance lives before it is reaped (defaults to CHALLENGE_INSTANCE_TTL)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="shared_expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(set_existing_deadlines, migrations.RunPython.noop),
+    ]
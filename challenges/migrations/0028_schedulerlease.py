@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "challenges",
+            "0027_activecontainer_expires_at_ctfchallenge_instance_ttl_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchedulerLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("holder", models.CharField(max_length=200)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+    ]
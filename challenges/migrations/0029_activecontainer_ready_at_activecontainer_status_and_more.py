@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0028_schedulerlease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activecontainer",
+            name="ready_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="activecontainer",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("starting", "Starting"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                default="starting",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="health_check_path",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="HTTP path polled to decide an instance is ready (e.g. /); empty means a plain TCP connect",
+                max_length=200,
+            ),
+        ),
+    ]
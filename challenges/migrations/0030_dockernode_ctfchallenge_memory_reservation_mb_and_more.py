@@ -0,0 +1,98 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0029_activecontainer_ready_at_activecontainer_status_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DockerNode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                (
+                    "base_url",
+                    models.CharField(
+                        help_text="Docker endpoint, e.g. tcp://10.0.0.5:2376 or ssh://ctf@node2",
+                        max_length=200,
+                    ),
+                ),
+                (
+                    "public_host",
+                    models.CharField(
+                        help_text="Host name/IP players and probes use to reach published ports",
+                        max_length=200,
+                    ),
+                ),
+                ("max_instances", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "memory_capacity_mb",
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                (
+                    "is_draining",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Draining nodes keep running instances but get no new ones",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="memory_reservation_mb",
+            field=models.PositiveIntegerField(
+                default=256,
+                help_text="Memory reserved on a node for each instance, used for placement",
+            ),
+        ),
+        migrations.AddField(
+            model_name="portlease",
+            name="node",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="portlease",
+            name="port",
+            field=models.IntegerField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="portlease",
+            unique_together={("node", "port")},
+        ),
+        migrations.AddField(
+            model_name="activecontainer",
+            name="node",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="challenges.dockernode",
+            ),
+        ),
+        migrations.AddField(
+            model_name="warminstance",
+            name="node",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="challenges.dockernode",
+            ),
+        ),
+    ]
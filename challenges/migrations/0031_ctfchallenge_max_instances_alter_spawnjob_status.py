@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0030_dockernode_ctfchallenge_memory_reservation_mb_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="max_instances",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Cap on concurrent isolated instances of this challenge (empty: no cap)",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="spawnjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("pending", "Pending"),
+                    ("starting", "Starting"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                default="pending",
+                max_length=10,
+            ),
+        ),
+    ]
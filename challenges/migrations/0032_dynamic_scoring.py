@@ -0,0 +1,54 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def set_solve_counts(apps, schema_editor):
+    CTFChallenge = apps.get_model("challenges", "CTFChallenge")
+    for challenge in CTFChallenge.objects.annotate(solves=Count("completedchallenge")):
+        challenge.solve_count = challenge.solves
+        challenge.current_points = challenge.points
+        challenge.save(update_fields=["solve_count", "current_points"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0031_ctfchallenge_max_instances_alter_spawnjob_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="current_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="decay",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Solves after the first until a dynamic challenge is down to `minimum_points`",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="is_dynamic",
+            field=models.BooleanField(
+                default=False,
+                help_text="Value decays from `points` towards `minimum_points` as more players solve it",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="minimum_points",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="ctfchallenge",
+            name="solve_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(set_solve_counts, migrations.RunPython.noop),
+    ]
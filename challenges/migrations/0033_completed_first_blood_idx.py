@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0032_dynamic_scoring"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="completedchallenge",
+            index=models.Index(
+                fields=["challenge", "completed_at"], name="completed_first_blood_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.db import migrations
+
+FTS_TABLE = "challenges_ctfchallenge_fts"
+TABLE = "challenges_ctfchallenge"
+GIN_INDEX = "challenges_ctfchallenge_search_idx"
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, type, content='{TABLE}', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, type)
+        VALUES (new.id, new.title, new.description, new.type);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, type)
+        VALUES ('delete', old.id, old.title, old.description, old.type);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF title, description, type ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, type)
+        VALUES ('delete', old.id, old.title, old.description, old.type);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, type)
+        VALUES (new.id, new.title, new.description, new.type);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """
+    SQLite: an external-content FTS5 table kept current by triggers.
+    Postgres: a GIN index on the weighted tsvector challenges.search uses.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        # frozen copy of challenges.search.search_vector() as of this migration
+        vector = (
+            SearchVector("title", weight="A", config="english")
+            + SearchVector("type", weight="B", config="english")
+            + SearchVector("description", weight="C", config="english")
+        )
+        schema_editor.add_index(
+            apps.get_model("challenges", "CTFChallenge"),
+            GinIndex(vector, name=GIN_INDEX),
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0033_completed_first_blood_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0034_challenge_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="completedchallenge",
+            index=models.Index(
+                fields=["user", "completed_at", "id"], name="completed_user_history_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ctfchallenge",
+            index=models.Index(
+                fields=["difficulty", "id"], name="challenge_difficulty_id_idx"
+            ),
+        ),
+    ]
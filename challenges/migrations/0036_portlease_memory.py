@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+def reserve_existing_memory(apps, schema_editor):
+    PortLease = apps.get_model("challenges", "PortLease")
+    ActiveContainer = apps.get_model("challenges", "ActiveContainer")
+    WarmInstance = apps.get_model("challenges", "WarmInstance")
+    for model in (ActiveContainer, WarmInstance):
+        rows = model.objects.values_list("project_name", "challenge__memory_reservation_mb")
+        for project_name, memory_mb in rows:
+            PortLease.objects.filter(project_name=project_name).update(memory_mb=memory_mb or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("challenges", "0035_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portlease",
+            name="memory_mb",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(reserve_existing_memory, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,37 @@
+import math
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 
 
+class DockerNode(models.Model):
+    """
+    A Docker daemon isolated instances can be placed on. With no nodes
+    configured everything runs on the default (local) daemon.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    base_url = models.CharField(max_length=200, help_text="Docker endpoint, e.g. tcp://10.0.0.5:2376 or ssh://ctf@node2")
+    public_host = models.CharField(max_length=200, help_text="Host name/IP players and probes use to reach published ports")
+    max_instances = models.PositiveIntegerField(blank=True, null=True)
+    memory_capacity_mb = models.PositiveIntegerField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    is_draining = models.BooleanField(default=False, help_text="Draining nodes keep running instances but get no new ones")
+
+    def __str__(self):
+        return self.name
+
+
+# fields a challenge's value is derived from (CTFChallenge.value_for)
+PRICING_FIELDS = frozenset(['points', 'is_dynamic', 'minimum_points', 'decay'])
+# counters maintained by challenges.scoring
+SCORING_FIELDS = frozenset(['solve_count', 'current_points'])
+
+
 class CTFChallenge(models.Model):
     DIFFICULTY_LEVELS = [
         (1, 'Easy'),
@@ -24,6 +53,40 @@ class CTFChallenge(models.Model):
     last_launched = models.DateTimeField(blank=True, null=True)
     is_static = models.BooleanField(default=False)
     is_isolated = models.BooleanField(default=False)
+    warm_pool_min = models.PositiveIntegerField(default=0,
+        help_text="Idle pre-started instances to keep ready (isolated challenges only)"
+    )
+    warm_pool_max = models.PositiveIntegerField(default=0,
+        help_text="Upper bound on idle pre-started instances; pre-warming fills up to this"
+    )
+    instance_ttl = models.PositiveIntegerField(blank=True, null=True,
+        help_text="Seconds an instance lives before it is reaped (defaults to CHALLENGE_INSTANCE_TTL)"
+    )
+    shared_expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    max_instances = models.PositiveIntegerField(blank=True, null=True,
+        help_text="Cap on concurrent isolated instances of this challenge (empty: no cap)"
+    )
+    memory_reservation_mb = models.PositiveIntegerField(default=256,
+        help_text="Memory reserved on a node for each instance, used for placement"
+    )
+    health_check_path = models.CharField(max_length=200, blank=True, default='',
+        help_text="HTTP path polled to decide an instance is ready (e.g. /); empty means a plain TCP connect"
+    )
+    is_dynamic = models.BooleanField(default=False,
+        help_text="Value decays from `points` towards `minimum_points` as more players solve it"
+    )
+    minimum_points = models.PositiveIntegerField(default=0)
+    decay = models.PositiveIntegerField(default=0,
+        help_text="Solves after the first until a dynamic challenge is down to `minimum_points`"
+    )
+    solve_count = models.PositiveIntegerField(default=0)  # maintained by challenges.scoring
+    current_points = models.IntegerField(default=0)  # what every solver is credited, maintained by challenges.scoring
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the challenge list
+            models.Index(fields=['difficulty', 'id'], name='challenge_difficulty_id_idx'),
+        ]
 
     def get_static_assets_path(self):
         """
@@ -32,6 +95,67 @@ class CTFChallenge(models.Model):
         """
         return f"assets/{slugify(self.title)}"
 
+    def value_for(self, solve_count):
+        """
+        Points the challenge is worth with `solve_count` solves: `points` for
+        static challenges, otherwise a quadratic decay from full value for
+        the first solve down to `minimum_points` once `decay` more players
+        have solved it.
+        """
+        if not self.is_dynamic or not self.decay:
+            return self.points
+        solves = max(solve_count - 1, 0)
+        value = (self.minimum_points - self.points) / (self.decay ** 2) * solves ** 2 + self.points
+        return max(math.ceil(value), self.minimum_points)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._priced_as = instance._pricing()
+        return instance
+
+    def _pricing(self):
+        # deferred fields are left out rather than loaded
+        return {name: self.__dict__.get(name) for name in PRICING_FIELDS}
+
+    def save(self, *args, **kwargs):
+        """
+        New challenges start at their full value; an edit to how a saved one
+        is priced re-prices it and shifts its solvers, whoever made the edit.
+        """
+        adding = self._state.adding
+        if adding:
+            self.current_points = self.value_for(self.solve_count)
+        elif kwargs.get('update_fields') is None:
+            # the counters may be stale in memory; only challenges.scoring writes them
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in SCORING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+        priced_as = getattr(self, '_priced_as', None)
+        self._priced_as = self._pricing()
+        if adding or PRICING_FIELDS.isdisjoint(kwargs['update_fields']):
+            return
+        if priced_as != self._priced_as:
+            from .scoring import reprice
+            reprice(self)
+
+    def get_instance_ttl(self):
+        return self.instance_ttl or getattr(settings, 'CHALLENGE_INSTANCE_TTL', 30 * 60)
+
+    def instance_deadline(self, now=None):
+        """
+        When an instance started now should be reaped.
+        """
+        return (now or timezone.now()) + timedelta(seconds=self.get_instance_ttl())
+
+    @property
+    def public_host(self):
+        # the shared stack always runs on the default daemon
+        return getattr(settings, 'CHALLENGE_PUBLIC_HOST', '127.0.0.1')
+
     def __str__(self) -> str:
         return f"{self.title}"
 
@@ -43,6 +167,12 @@ class CompletedChallenge(models.Model):
 
     class Meta:
         unique_together = ("user", "challenge")
+        indexes = [
+            # first blood per challenge
+            models.Index(fields=['challenge', 'completed_at'], name='completed_first_blood_idx'),
+            # keyset pagination of a player's solve history
+            models.Index(fields=['user', 'completed_at', 'id'], name='completed_user_history_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.user.username} - {self.challenge.title}"
@@ -52,12 +182,180 @@ class ActiveContainer(models.Model):
     """
     Tracks active per-user container instances (only used for isolated challenges).
     """
+    STARTING = 'starting'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STARTING, 'Starting'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     challenge = models.ForeignKey(CTFChallenge, on_delete=models.CASCADE)
     project_name = models.CharField(max_length=150, unique=True)
     host_port = models.IntegerField()  # host port that maps to container's internal_port
     compose_temp_path = models.CharField(max_length=1024, blank=True, null=True)  # temp file path
     started_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)  # reaped once this passes
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STARTING, db_index=True)
+    ready_at = models.DateTimeField(blank=True, null=True)  # first successful readiness probe
+    node = models.ForeignKey(DockerNode, on_delete=models.PROTECT, blank=True, null=True)  # None: default daemon
+
+    @property
+    def public_host(self):
+        if self.node:
+            return self.node.public_host
+        return getattr(settings, 'CHALLENGE_PUBLIC_HOST', '127.0.0.1')
+
+    @property
+    def container_state(self):
+        """
+        Live state from the cached status snapshot (no Docker call), or None
+        if the snapshot cannot tell yet.
+        """
+        from .snapshot import container_state
+        return container_state(self.project_name, self.started_at)
+
+    @property
+    def time_to_ready(self):
+        """
+        Seconds from start until the service first answered, or None.
+        """
+        if self.ready_at is None:
+            return None
+        return (self.ready_at - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.user.username} - {self.challenge.title} ({self.project_name})"
+
+class WarmInstance(models.Model):
+    """
+    A pre-started isolated instance waiting to be handed to a player.
+    Claiming one turns it into an ActiveContainer without running docker-compose.
+    """
+    challenge = models.ForeignKey(CTFChallenge, on_delete=models.CASCADE, related_name='warm_instances')
+    project_name = models.CharField(max_length=150, unique=True)
+    host_port = models.IntegerField()
+    compose_temp_path = models.CharField(max_length=1024, blank=True, null=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    node = models.ForeignKey(DockerNode, on_delete=models.PROTECT, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.challenge.title} warm ({self.project_name})"
+
+
+class PortLease(models.Model):
+    """
+    A host port handed out to a challenge instance. The unique constraint on
+    (node, port) is what guarantees no two workers ever publish the same port
+    on the same daemon. node is the DockerNode name, '' for the default daemon.
+    The lease exists from placement until teardown, so it also carries the
+    instance's memory reservation and is what node load is counted from.
+    """
+    node = models.CharField(max_length=100, blank=True, default='')
+    port = models.IntegerField()
+    project_name = models.CharField(max_length=150, db_index=True)
+    memory_mb = models.PositiveIntegerField(default=0)
+    leased_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("node", "port")
+
+    def __str__(self):
+        return f"{self.port} -> {self.project_name}"
+
+
+class SchedulerLease(models.Model):
+    """
+    A named, expiring lease. The background scheduler's leader lease (whoever
+    holds it runs the periodic jobs; everyone else stands by) and the
+    per-daemon compose slots of challenges.jobs.compose_slot().
+    """
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=200)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder} until {self.expires_at}"
+
+
+class SpawnJob(models.Model):
+    """
+    A queued start/stop request for a challenge environment.
+    Jobs are executed by the bounded worker pool in challenges.jobs so the
+    HTTP request returns immediately; clients poll the status endpoint.
+    """
+    SPAWN = 'spawn'
+    STOP = 'stop'
+    ACTION_CHOICES = [
+        (SPAWN, 'Spawn'),
+        (STOP, 'Stop'),
+    ]
+
+    QUEUED = 'queued'
+    PENDING = 'pending'
+    STARTING = 'starting'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (PENDING, 'Pending'),
+        (STARTING, 'Starting'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+    UNFINISHED = [QUEUED, PENDING, STARTING]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    challenge = models.ForeignKey(CTFChallenge, on_delete=models.CASCADE)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default=SPAWN)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.READY, self.FAILED)
 
     def __str__(self):
-        return f"{self.user.username} - {self.challenge.title} ({self.project_name})"
\ No newline at end of file
+        return f"{self.action} {self.challenge.title} for {self.user.username} ({self.status})"
+
+
+# CTFChallenge fields that track a running shared stack, not what players
+# see in the catalog; saving only these leaves the cached pages alone
+RUNTIME_FIELDS = frozenset(['last_launched', 'shared_expires_at'])
+
+
+def _runtime_only(update_fields):
+    return bool(update_fields) and update_fields <= RUNTIME_FIELDS
+
+
+@receiver([post_save, post_delete], sender=CTFChallenge)
+def invalidate_challenge_facets(sender, update_fields=None, **kwargs):
+    if _runtime_only(update_fields):
+        return
+    from .catalog import invalidate_facets
+    invalidate_facets()
+
+
+@receiver([post_save, post_delete], sender=CTFChallenge)
+def retire_challenge_fragments(sender, instance, update_fields=None, **kwargs):
+    if _runtime_only(update_fields):
+        return
+    from .fragments import bump, CATALOG, CHALLENGE
+    bump((CATALOG,), (CHALLENGE, instance.pk))
+
+
+@receiver([post_save, post_delete], sender=CompletedChallenge)
+def retire_solve_fragments(sender, instance, **kwargs):
+    from .fragments import bump, CHALLENGE, USER
+    # the row's solve count / first blood, and the solver's badges
+    bump((CHALLENGE, instance.challenge_id), (USER, instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=ActiveContainer)
+def retire_instance_fragments(sender, instance, **kwargs):
+    from .fragments import bump, USER
+    bump((USER, instance.user_id))
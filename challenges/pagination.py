@@ -0,0 +1,120 @@
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = "challenges.pagination"
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated queryset. Iterating yields the rows;
+    next_cursor / previous_cursor are opaque tokens (None at either end)
+    and count is only set when it was asked for.
+    """
+
+    def __init__(self, items, next_cursor, previous_cursor, count=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _fields(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _key(row, fields):
+    key = []
+    for name, _ in fields:
+        value = getattr(row, name)
+        key.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return key
+
+
+def _encode(key, direction):
+    return signing.dumps({'k': key, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+
+def _decode(token, model, fields):
+    """
+    (key values, direction) from a cursor token, or None for a missing,
+    tampered or stale token (which restarts from the first page).
+    """
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, data['k'])]
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if len(values) != len(fields) or data.get('d') not in ('next', 'prev'):
+        return None
+    return values, data['d']
+
+
+def _after(fields, values, backwards):
+    """
+    Rows strictly past `values` in the ordering (before them if backwards):
+    (a > x) OR (a = x AND b > y) OR ..., each comparison flipped for
+    descending fields, so an index on the ordering columns serves it.
+    """
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending != backwards else 'gt'
+        term = Q(**{f"{name}__{lookup}": values[i]})
+        for j in range(i):
+            term &= Q(**{fields[j][0]: values[j]})
+        condition |= term
+    return condition
+
+
+def paginate(queryset, ordering, cursor=None, per_page=10, with_count=False):
+    """
+    Keyset pagination: the page after (or before) the cursor's row in
+    `ordering`, which must end in a unique field such as 'id'. Each page is
+    one LIMIT query seeking from the cursor, however deep it is; COUNT(*)
+    only runs with with_count=True.
+    """
+    fields = _fields(ordering)
+    decoded = _decode(cursor, queryset.model, fields)
+    backwards = bool(decoded) and decoded[1] == 'prev'
+
+    count = queryset.count() if with_count else None
+    if backwards:
+        reverse = [name[1:] if name.startswith('-') else f"-{name}" for name in ordering]
+        page = queryset.order_by(*reverse)
+    else:
+        page = queryset.order_by(*ordering)
+    if decoded:
+        page = page.filter(_after(fields, decoded[0], backwards))
+
+    rows = list(page[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return CursorPage([], None, None, count)
+    # going forwards there is a previous page iff we came from a cursor, and vice versa
+    has_next = more if not backwards else True
+    has_previous = bool(decoded) if not backwards else more
+    return CursorPage(
+        rows,
+        _encode(_key(rows[-1], fields), 'next') if has_next else None,
+        _encode(_key(rows[0], fields), 'prev') if has_previous else None,
+        count,
+    )
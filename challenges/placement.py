@@ -0,0 +1,134 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .models import DockerNode, PortLease
+from .ports import allocate_port, get_port_range
+from .scheduler import acquire_lease, default_holder, release_lease
+
+PLACEMENT_LEASE = 'challenges-placement'
+
+
+class NoCapacityError(RuntimeError):
+    pass
+
+
+def node_loads(nodes=None):
+    """
+    Instance count, reserved memory and free ports per node, from one
+    grouped query on the port leases. Every instance on a node holds a
+    lease from placement until teardown, so spawns still starting are
+    counted too. Returns {node_id: {...}}.
+    """
+    nodes = list(DockerNode.objects.filter(is_active=True)) if nodes is None else list(nodes)
+    loads = {
+        node.id: {'node': node, 'instances': 0, 'memory_mb': 0, 'ports_in_use': 0}
+        for node in nodes
+    }
+    by_name = {node.name: node.id for node in nodes}
+    leases = (
+        PortLease.objects.filter(node__in=by_name.keys())
+        .values('node')
+        .annotate(n=Count('id'), memory_mb=Sum('memory_mb'))
+    )
+    for row in leases:
+        load = loads[by_name[row['node']]]
+        load['instances'] = load['ports_in_use'] = row['n']
+        load['memory_mb'] = row['memory_mb'] or 0
+
+    start, end = get_port_range()
+    for load in loads.values():
+        load['free_ports'] = (end - start + 1) - load['ports_in_use']
+    return loads
+
+
+def _fits(load, challenge):
+    node = load['node']
+    if node.max_instances is not None and load['instances'] + 1 > node.max_instances:
+        return False
+    if node.memory_capacity_mb is not None and load['memory_mb'] + challenge.memory_reservation_mb > node.memory_capacity_mb:
+        return False
+    return load['free_ports'] > 0
+
+
+def _utilisation(load):
+    """
+    The node's fullest dimension as a 0..1 fraction; nodes without limits
+    are compared by raw instance count.
+    """
+    node = load['node']
+    ratios = []
+    if node.max_instances:
+        ratios.append(load['instances'] / node.max_instances)
+    if node.memory_capacity_mb:
+        ratios.append(load['memory_mb'] / node.memory_capacity_mb)
+    return max(ratios) if ratios else load['instances']
+
+
+def pick_node(challenge):
+    """
+    The least-loaded active, non-draining node that can take one more
+    instance of the challenge. Returns None when no node is active
+    (everything runs on the default daemon); raises NoCapacityError when
+    active nodes exist but all are full or draining.
+    """
+    active = DockerNode.objects.filter(is_active=True)
+    if not active.exists():
+        return None
+
+    candidates = node_loads(active.filter(is_draining=False)).values()
+    candidates = [load for load in candidates if _fits(load, challenge)]
+    if not candidates:
+        raise NoCapacityError("No Docker node has capacity for another instance")
+
+    best = min(candidates, key=lambda load: (_utilisation(load), load['instances'], -load['free_ports']))
+    return best['node']
+
+
+@contextmanager
+def placement_lease():
+    """
+    Hold the placement lease, waiting for it if another process has it.
+    Picking a node and leasing its port must not interleave between
+    workers, or each would see the same spare capacity and overshoot it.
+    """
+    holder = f"{default_holder()}:{uuid.uuid4().hex[:8]}"
+    ttl = getattr(settings, 'CHALLENGE_PLACEMENT_LEASE_TTL', 30)
+    while not acquire_lease(holder, ttl, PLACEMENT_LEASE):
+        time.sleep(getattr(settings, 'CHALLENGE_PLACEMENT_POLL', 0.05))
+    try:
+        yield
+    finally:
+        release_lease(holder, PLACEMENT_LEASE)
+
+
+def place_instance(challenge, project_name):
+    """
+    Pick a node for a new instance of the challenge and lease its host port
+    there, reserving the challenge's memory on it. Returns (host_port, node).
+    """
+    with placement_lease():
+        node = pick_node(challenge)
+        return allocate_port(project_name, node, challenge.memory_reservation_mb), node
+
+
+def cluster_summary():
+    """
+    Per-node load, for the nodes command and admin views.
+    """
+    summary = {}
+    for load in node_loads(DockerNode.objects.all()).values():
+        node = load['node']
+        summary[node.name] = {
+            'instances': load['instances'],
+            'max_instances': node.max_instances,
+            'memory_mb': load['memory_mb'],
+            'memory_capacity_mb': node.memory_capacity_mb,
+            'free_ports': load['free_ports'],
+            'draining': node.is_draining,
+            'active': node.is_active,
+        }
+    return summary
@@ -0,0 +1,149 @@
+import logging
+import random
+import string
+import threading
+
+from django.db import close_old_connections, transaction
+
+from .admission import warm_memory_fits
+from .jobs import get_executor, start_isolated_instance, stop_isolated_instance
+from .models import ActiveContainer, CTFChallenge, WarmInstance
+
+logger = logging.getLogger(__name__)
+
+# challenge ids with a refill already queued in this process
+_refilling = set()
+_refilling_lock = threading.Lock()
+
+
+def generate_warm_project_name(challenge):
+    rand = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
+    return f"warm_ch{challenge.id}_{rand}"
+
+
+def claim_warm_instance(user, challenge):
+    """
+    Hand an idle pre-started instance to the user as their ActiveContainer.
+    Returns the new ActiveContainer, or None when the pool is empty.
+    """
+    if not challenge.is_isolated or not challenge.warm_pool_max:
+        return None
+
+    warm_instances = (
+        WarmInstance.objects.filter(challenge=challenge)
+        .exclude(node__is_draining=True)
+        .select_related('node')
+        .order_by('started_at')
+    )
+    for warm in warm_instances:
+        with transaction.atomic():
+            # the delete doubles as the claim: only one caller can remove the row
+            deleted, _ = WarmInstance.objects.filter(pk=warm.pk).delete()
+            if not deleted:
+                continue
+            active = ActiveContainer.objects.create(
+                user=user,
+                challenge=challenge,
+                project_name=warm.project_name,
+                host_port=warm.host_port,
+                compose_temp_path=warm.compose_temp_path,
+                node=warm.node,
+                expires_at=challenge.instance_deadline(),
+            )
+        schedule_refill(challenge)
+        return active
+
+    schedule_refill(challenge)
+    return None
+
+
+def schedule_refill(challenge, target=None):
+    """
+    Top the challenge's pool up in the background on the job worker pool.
+    """
+    if not challenge.is_isolated or not challenge.warm_pool_max:
+        return
+    with _refilling_lock:
+        if challenge.id in _refilling:
+            return
+        _refilling.add(challenge.id)
+    transaction.on_commit(lambda: get_executor().submit(_refill_worker, challenge.id, target))
+
+
+def _refill_worker(challenge_id, target):
+    close_old_connections()
+    try:
+        challenge = CTFChallenge.objects.get(pk=challenge_id)
+        refill_pool(challenge, target)
+    except Exception:
+        logger.exception("Warm pool refill failed for challenge %s", challenge_id)
+    finally:
+        with _refilling_lock:
+            _refilling.discard(challenge_id)
+        close_old_connections()
+
+
+def refill_pool(challenge, target=None):
+    """
+    Start instances until the pool holds `target` idle instances (defaults to
+    warm_pool_min), never exceeding warm_pool_max or the reserved memory
+    cap. Extra idle instances above warm_pool_max are stopped. Returns the number of instances started.
+    """
+    if not challenge.is_isolated:
+        return 0
+
+    target = challenge.warm_pool_min if target is None else target
+    target = min(target, challenge.warm_pool_max)
+
+    idle = WarmInstance.objects.filter(challenge=challenge).count()
+    started = 0
+    while idle < target:
+        if not warm_memory_fits(challenge):
+            # idle instances reserve memory like live ones; keep it for players
+            break
+        project_name = generate_warm_project_name(challenge)
+        host_port, node = start_isolated_instance(challenge, project_name)
+        WarmInstance.objects.create(
+            challenge=challenge,
+            project_name=project_name,
+            host_port=host_port,
+            node=node,
+        )
+        idle += 1
+        started += 1
+
+    trim_pool(challenge)
+    return started
+
+
+def trim_pool(challenge):
+    """
+    Stop idle instances above warm_pool_max, newest first.
+    """
+    surplus = WarmInstance.objects.filter(challenge=challenge).select_related('node').order_by('-started_at')
+    surplus = list(surplus[:max(surplus.count() - challenge.warm_pool_max, 0)])
+    for warm in surplus:
+        deleted, _ = WarmInstance.objects.filter(pk=warm.pk).delete()
+        if deleted:
+            stop_isolated_instance(challenge, warm.project_name, warm.host_port, warm.compose_temp_path, warm.node)
+    return len(surplus)
+
+
+def fill_all_pools(prewarm=False):
+    """
+    Refill every isolated challenge's pool. With prewarm, fill up to
+    warm_pool_max instead of warm_pool_min (e.g. right before an event).
+    """
+    challenges = CTFChallenge.objects.filter(is_isolated=True, warm_pool_max__gt=0)
+    return {
+        challenge.title: refill_pool(challenge, challenge.warm_pool_max if prewarm else None)
+        for challenge in challenges
+    }
+
+
+def schedule_all_refills():
+    """
+    Scheduler task: queue a background refill for every pooled challenge.
+    """
+    for challenge in CTFChallenge.objects.filter(is_isolated=True, warm_pool_max__gt=0):
+        schedule_refill(challenge)
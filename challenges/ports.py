@@ -0,0 +1,94 @@
+import random
+import socket
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import CTFChallenge, PortLease
+
+# how many ports are checked against the lease table per query
+SCAN_WINDOW = 256
+
+# next-fit cursor per node: allocations continue where the previous one stopped
+_cursors = {}
+_cursor_lock = threading.Lock()
+
+
+def get_port_range():
+    return getattr(settings, 'CHALLENGE_PORT_RANGE', (20000, 60000))
+
+
+def _is_bindable(port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(('0.0.0.0', port))
+            return True
+        except OSError:
+            return False
+
+
+def allocate_port(project_name, node=None, memory_mb=0):
+    """
+    Lease a free host port on the node (None: the default daemon) for the
+    given compose project, recording the memory it reserves there. Leased
+    ports are skipped a window at a time, and the insert itself is the
+    claim, so concurrent workers in any process can never get the same port.
+    """
+    node_name = node.name if node else ''
+    start, end = get_port_range()
+    with _cursor_lock:
+        cursor = _cursors.setdefault(node_name, random.randint(start, end))
+
+    # ports pinned by shared challenges (default daemon) are never handed out
+    reserved = set()
+    if not node:
+        reserved = set(CTFChallenge.objects.exclude(host_port__isnull=True).values_list('host_port', flat=True))
+
+    scanned = 0
+    size = end - start + 1
+    while scanned < size:
+        window_end = min(cursor + SCAN_WINDOW, end + 1)
+        leased = set(
+            PortLease.objects.filter(node=node_name, port__gte=cursor, port__lt=window_end).values_list('port', flat=True)
+        )
+        for port in range(cursor, window_end):
+            if port in leased or port in reserved:
+                continue
+            try:
+                with transaction.atomic():
+                    PortLease.objects.create(node=node_name, port=port, project_name=project_name, memory_mb=memory_mb)
+            except IntegrityError:
+                # another worker leased it first
+                continue
+            if not node and not _is_bindable(port):
+                # taken by something outside the platform
+                PortLease.objects.filter(node=node_name, port=port, project_name=project_name).delete()
+                continue
+            with _cursor_lock:
+                _cursors[node_name] = port + 1 if port < end else start
+            return port
+        scanned += window_end - cursor
+        cursor = window_end if window_end <= end else start
+
+    raise RuntimeError("No free host ports left in CHALLENGE_PORT_RANGE")
+
+
+def release_ports(project_name):
+    """
+    Return every port leased to the project. Safe to call more than once.
+    """
+    deleted, _ = PortLease.objects.filter(project_name=project_name).delete()
+    return deleted
+
+
+def port_usage(node=None):
+    start, end = get_port_range()
+    capacity = end - start + 1
+    in_use = PortLease.objects.filter(node=node.name if node else '').count()
+    return {
+        'in_use': in_use,
+        'free': capacity - in_use,
+        'capacity': capacity,
+        'range': (start, end),
+    }
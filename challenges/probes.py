@@ -0,0 +1,94 @@
+import asyncio
+
+from django.conf import settings
+from django.utils import timezone
+
+from .fragments import bump, USER
+from .models import ActiveContainer
+
+
+async def probe_tcp(host, port, timeout):
+    """
+    True if something accepts a TCP connection on host:port.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def probe_http(host, port, path, timeout):
+    """
+    True if an HTTP GET on path gets any non-5xx response.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.0\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        parts = status_line.decode(errors='replace').split()
+        return len(parts) >= 2 and parts[0].startswith("HTTP/") and parts[1].isdigit() and int(parts[1]) < 500
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+async def probe_all(targets, timeout):
+    """
+    Probe (host, port, path) targets concurrently; path None means TCP only.
+    Returns a list of booleans in the same order.
+    """
+    return await asyncio.gather(*[
+        probe_http(host, port, path, timeout) if path else probe_tcp(host, port, timeout)
+        for host, port, path in targets
+    ])
+
+
+def probe_host(active):
+    if active.node:
+        return active.node.public_host
+    return getattr(settings, 'CHALLENGE_PROBE_HOST', '127.0.0.1')
+
+
+def probe_pending_instances():
+    """
+    Scheduler task: probe every starting instance at once and flip the ones
+    that answer to ready, recording when. Instances that stay silent past
+    CHALLENGE_READINESS_TIMEOUT are marked failed.
+    """
+    pending = list(ActiveContainer.objects.filter(status=ActiveContainer.STARTING).select_related('challenge', 'node'))
+    if not pending:
+        return
+
+    timeout = getattr(settings, 'CHALLENGE_PROBE_TIMEOUT', 2)
+    results = asyncio.run(probe_all(
+        [(probe_host(a), a.host_port, a.challenge.health_check_path or None) for a in pending],
+        timeout,
+    ))
+
+    now = timezone.now()
+    give_up = getattr(settings, 'CHALLENGE_READINESS_TIMEOUT', 120)
+    ready = [a.pk for a, ok in zip(pending, results) if ok]
+    failed = [a.pk for a, ok in zip(pending, results) if not ok and (now - a.started_at).total_seconds() > give_up]
+    if ready:
+        ActiveContainer.objects.filter(pk__in=ready, status=ActiveContainer.STARTING).update(
+            status=ActiveContainer.READY, ready_at=now
+        )
+    if failed:
+        ActiveContainer.objects.filter(pk__in=failed, status=ActiveContainer.STARTING).update(
+            status=ActiveContainer.FAILED
+        )
+        # a failed instance no longer shows as running in the challenge list
+        bump(*[(USER, a.user_id) for a in pending if a.pk in failed])
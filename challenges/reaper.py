@@ -0,0 +1,119 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Min
+from django.utils import timezone
+
+from .backends import get_backend, MISSING
+from .jobs import compose_slot, stop_isolated_instance
+from .models import ActiveContainer, CTFChallenge
+from .shared import set_shared_state
+from .utils import shared_project_name, load_compose
+
+logger = logging.getLogger(__name__)
+
+# expired rows handled per cycle; the rest are picked up on the next pass
+REAP_BATCH_SIZE = 100
+
+
+def _teardown_instance(active):
+    close_old_connections()
+    try:
+        stop_isolated_instance(
+            active.challenge, active.project_name, active.host_port, active.compose_temp_path, active.node
+        )
+    except Exception:
+        logger.exception("Failed to reap %s", active.project_name)
+    finally:
+        close_old_connections()
+
+
+def _teardown_shared(challenge):
+    close_old_connections()
+    try:
+        base_dir = os.path.abspath(challenge.compose_path)
+        with compose_slot():
+            get_backend().down(
+                shared_project_name(challenge),
+                load_compose(os.path.join(base_dir, "docker-compose.yml")),
+                base_dir,
+            )
+        # otherwise spawns would see the cached "running" until it expires
+        set_shared_state(challenge, MISSING)
+    except Exception:
+        logger.exception("Failed to stop shared challenge %s", challenge.id)
+    finally:
+        close_old_connections()
+
+
+def reap_expired(now=None, executor=None):
+    """
+    Tear down every instance and shared stack whose deadline has passed.
+    Only expired rows are read (via the expires_at indexes), and teardowns
+    run in parallel on the executor. Returns the number of environments reaped.
+    """
+    now = now or timezone.now()
+
+    expired = list(
+        ActiveContainer.objects.filter(expires_at__lte=now)
+        .select_related('challenge', 'node')
+        .order_by('expires_at')[:REAP_BATCH_SIZE]
+    )
+    claimed = []
+    for active in expired:
+        # deleting the row is the claim, so an instance is never torn down twice
+        deleted, _ = ActiveContainer.objects.filter(pk=active.pk).delete()
+        if deleted:
+            claimed.append(active)
+
+    shared = []
+    for challenge in CTFChallenge.objects.filter(shared_expires_at__lte=now)[:REAP_BATCH_SIZE]:
+        updated = CTFChallenge.objects.filter(pk=challenge.pk, shared_expires_at=challenge.shared_expires_at).update(
+            shared_expires_at=None, last_launched=None
+        )
+        if updated:
+            shared.append(challenge)
+
+    if not claimed and not shared:
+        return 0
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=getattr(settings, 'CHALLENGE_REAPER_CONCURRENCY', 8)) as pool:
+            return _run_teardowns(pool, claimed, shared)
+    return _run_teardowns(executor, claimed, shared)
+
+
+def _run_teardowns(executor, claimed, shared):
+    futures = [executor.submit(_teardown_instance, active) for active in claimed]
+    futures += [executor.submit(_teardown_shared, challenge) for challenge in shared]
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+def next_deadline():
+    """
+    The earliest pending expiry, or None when nothing is running.
+    """
+    deadlines = [
+        ActiveContainer.objects.aggregate(deadline=Min('expires_at'))['deadline'],
+        CTFChallenge.objects.aggregate(deadline=Min('shared_expires_at'))['deadline'],
+    ]
+    deadlines = [d for d in deadlines if d is not None]
+    return min(deadlines) if deadlines else None
+
+
+def reaper_task(executor=None):
+    """
+    Scheduler task: reap what has expired and return how many seconds to
+    wait before the next pass, i.e. until the next deadline but never more
+    than CHALLENGE_REAPER_MAX_SLEEP so instances started elsewhere are noticed.
+    """
+    max_sleep = getattr(settings, 'CHALLENGE_REAPER_MAX_SLEEP', 5)
+    reap_expired(executor=executor)
+    deadline = next_deadline()
+    if deadline is None:
+        return max_sleep
+    return min(max((deadline - timezone.now()).total_seconds(), 0.5), max_sleep)
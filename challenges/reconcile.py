@@ -0,0 +1,107 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .backends import get_backend, EXITED, PLATFORM_LABEL
+from .jobs import compose_slot, stop_isolated_instance
+from .models import ActiveContainer, CTFChallenge, DockerNode, PortLease, WarmInstance
+from .ports import release_ports
+from .utils import shared_project_name
+
+logger = logging.getLogger(__name__)
+
+
+def _known_rows(node):
+    """
+    {project_name: row} for every instance the DB places on the node.
+    """
+    rows = {}
+    for model in (WarmInstance, ActiveContainer):
+        for row in model.objects.filter(node=node).select_related('challenge', 'node'):
+            rows[row.project_name] = row
+    return rows
+
+
+def _teardown(row):
+    try:
+        stop_isolated_instance(row.challenge, row.project_name, row.host_port, row.compose_temp_path, row.node)
+    except Exception:
+        logger.exception("Failed to stop exited instance %s", row.project_name)
+
+
+def reconcile_node(node, now=None):
+    """
+    Compare the DB with what the node's daemon actually runs, using one
+    listing of compose projects and one of platform-labelled projects:
+
+    - rows whose containers are gone (after a grace period for stacks still
+      coming up) are deleted and their ports released;
+    - rows whose containers all exited are torn down and deleted;
+    - platform-labelled projects nothing in the DB refers to are removed.
+
+    Returns a dict of counts.
+    """
+    now = now or timezone.now()
+    grace = timedelta(seconds=getattr(settings, 'CHALLENGE_RECONCILE_GRACE', 120))
+    backend = get_backend(node)
+    live = backend.list()
+    labelled = backend.list(label=PLATFORM_LABEL)
+    known = _known_rows(node)
+    counts = {'ghosts': 0, 'exited': 0, 'orphans': 0}
+
+    ghosts = [name for name, row in known.items() if name not in live and row.started_at < now - grace]
+    if ghosts:
+        for model in (WarmInstance, ActiveContainer):
+            model.objects.filter(project_name__in=ghosts).delete()
+        PortLease.objects.filter(project_name__in=ghosts).delete()
+        counts['ghosts'] = len(ghosts)
+
+    for name, row in known.items():
+        if live.get(name) != EXITED:
+            continue
+        # deleting the row is the claim, so a concurrent stop or reap cannot double up
+        deleted, _ = type(row).objects.filter(pk=row.pk).delete()
+        if deleted:
+            _teardown(row)
+            counts['exited'] += 1
+
+    if node is None:
+        shared = {shared_project_name(c) for c in CTFChallenge.objects.filter(is_isolated=False).only('id')}
+    else:
+        shared = set()
+    # a fresh lease means a spawn is between allocating its port and saving its row
+    leased = set(
+        PortLease.objects.filter(project_name__in=labelled.keys(), leased_at__gte=now - grace)
+        .values_list('project_name', flat=True)
+    )
+    for name in labelled:
+        if name in known or name in shared or name in leased:
+            continue
+        try:
+            with compose_slot(node):
+                backend.remove_project(name)
+        except Exception:
+            logger.exception("Failed to remove orphaned project %s", name)
+            continue
+        release_ports(name)
+        counts['orphans'] += 1
+    return counts
+
+
+def reconcile(now=None):
+    """
+    Scheduler task: reconcile the default daemon and every active node.
+    A node whose daemon cannot be reached is skipped, never treated as empty.
+    """
+    totals = {'ghosts': 0, 'exited': 0, 'orphans': 0}
+    for node in [None, *DockerNode.objects.filter(is_active=True)]:
+        try:
+            counts = reconcile_node(node, now)
+        except Exception:
+            logger.exception("Failed to reconcile %s", node or 'default')
+            continue
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
@@ -0,0 +1,170 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'challenges-scheduler'
+
+
+class PeriodicTask:
+    """
+    A job the leader runs every `interval` seconds. If func returns a number,
+    it overrides the delay until its next run.
+    """
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = 0
+
+    def run_if_due(self, now):
+        if now < self.next_run:
+            return
+        delay = self.interval
+        try:
+            result = self.func()
+            if isinstance(result, (int, float)):
+                delay = result
+        except Exception:
+            logger.exception("Scheduler task %s failed", self.name)
+        self.next_run = time.monotonic() + delay
+
+
+def get_periodic_tasks():
+    from .admission import dispatch_queue
+    from .jobs import recover_stale_jobs
+    from .pool import schedule_all_refills
+    from .probes import probe_pending_instances
+    from .reaper import reaper_task
+    from .reconcile import reconcile
+    from .snapshot import refresh_snapshot
+
+    return [
+        PeriodicTask('reaper', reaper_task, getattr(settings, 'CHALLENGE_REAPER_MAX_SLEEP', 5)),
+        PeriodicTask('warm_pools', schedule_all_refills, getattr(settings, 'CHALLENGE_WARM_POOL_INTERVAL', 30)),
+        PeriodicTask('admission', dispatch_queue, getattr(settings, 'CHALLENGE_ADMISSION_INTERVAL', 1)),
+        PeriodicTask('readiness', probe_pending_instances, getattr(settings, 'CHALLENGE_PROBE_INTERVAL', 1)),
+        PeriodicTask('status_snapshot', refresh_snapshot, getattr(settings, 'CHALLENGE_STATUS_SNAPSHOT_INTERVAL', 5)),
+        PeriodicTask('reconcile', reconcile, getattr(settings, 'CHALLENGE_RECONCILE_INTERVAL', 60)),
+        PeriodicTask('stale_jobs', recover_stale_jobs, getattr(settings, 'CHALLENGE_JOB_RECOVERY_INTERVAL', 60)),
+    ]
+
+
+def default_holder():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(holder, ttl, name=LEASE_NAME):
+    """
+    Take or renew the leader lease. Returns True if `holder` is now leader.
+    The conditional UPDATE / unique INSERT make this safe across nodes.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+    updated = SchedulerLease.objects.filter(name=name).filter(
+        Q(holder=holder) | Q(expires_at__lt=now)
+    ).update(holder=holder, expires_at=expires_at)
+    if updated:
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=name, holder=holder, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(holder, name=LEASE_NAME):
+    SchedulerLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now())
+
+
+def _heartbeat(holder, ttl, done, lost):
+    """
+    Keep renewing the lease every third of its lifetime while the tasks of
+    one tick run, so a long task does not let it lapse; set `lost` and stop
+    if another holder has it.
+    """
+    try:
+        while not done.wait(ttl / 3):
+            try:
+                renewed = acquire_lease(holder, ttl)
+            except Exception:
+                renewed = False
+            if not renewed:
+                lost.set()
+                return
+    finally:
+        connection.close()
+
+
+def run_due_tasks(tasks, holder, ttl):
+    """
+    Run the due tasks with the lease kept alive in the background, stopping
+    before the next task once it is lost. Returns False if it was lost.
+    """
+    done, lost = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(holder, ttl, done, lost), daemon=True)
+    heartbeat.start()
+    try:
+        for task in tasks:
+            if lost.is_set():
+                break
+            task.run_if_due(time.monotonic())
+    finally:
+        done.set()
+        heartbeat.join()
+    return not lost.is_set()
+
+
+def run_scheduler(holder=None, once=False, log=logger.info):
+    """
+    Main loop of the scheduler process. Every tick it renews (or tries to
+    take) the leader lease and, while leader, runs whichever tasks are due,
+    renewing the lease as they run and stepping down as soon as it is lost.
+    Leadership changes go to `log`, the module logger unless a caller (the
+    management command) wants them on its console.
+    """
+    holder = holder or default_holder()
+    ttl = getattr(settings, 'CHALLENGE_SCHEDULER_LEASE_TTL', 30)
+    tick = getattr(settings, 'CHALLENGE_SCHEDULER_TICK', 1)
+    tasks = get_periodic_tasks()
+    leader = False
+
+    try:
+        while True:
+            close_old_connections()
+            try:
+                is_leader = acquire_lease(holder, ttl)
+            except Exception as e:
+                log(f"Could not reach the lease table: {e}")
+                is_leader = False
+
+            if is_leader != leader:
+                leader = is_leader
+                log(f"{holder} is {'now' if leader else 'no longer'} the scheduler leader")
+                for task in tasks:
+                    task.next_run = 0
+
+            if leader and not run_due_tasks(tasks, holder, ttl):
+                leader = False
+                log(f"{holder} lost the scheduler lease mid-tick and stepped down")
+
+            if once:
+                break
+            time.sleep(tick)
+    finally:
+        if leader:
+            release_lease(holder)
+        close_old_connections()
@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from user_management.models import UserProfile
+from user_management.scoreboard import record_adjustment, invalidate
+from .fragments import bump, CHALLENGE
+from .models import CTFChallenge, CompletedChallenge
+
+
+def _solvers(challenge, exclude_user=None):
+    solvers = CompletedChallenge.objects.filter(challenge=challenge)
+    if exclude_user is not None:
+        solvers = solvers.exclude(user=exclude_user)
+    return solvers.values('user_id')
+
+
+def _shift_solvers(challenge, delta, exclude_user=None):
+    """
+    Add `delta` to the score of everyone who solved the challenge, in one
+    UPDATE ... WHERE user_id IN (solvers), and publish their new scores.
+    """
+    if not delta:
+        return 0
+    updated = UserProfile.objects.filter(user_id__in=_solvers(challenge, exclude_user)).update(
+        score=F('score') + delta
+    )
+    if updated:
+        record_adjustment(list(_solvers(challenge, exclude_user).values_list('user_id', flat=True)))
+    return updated
+
+
+def count_solve(challenge, user):
+    """
+    Account for a new solve inside the caller's transaction: bump the
+    challenge's solve counter, re-price it and shift the earlier solvers by
+    the change in value. Returns the points to credit the new solver.
+    The challenge row is locked first, so solves of one challenge serialise.
+    """
+    locked = CTFChallenge.objects.select_for_update(no_key=True).get(pk=challenge.pk)
+    old_value = locked.current_points
+    locked.solve_count += 1
+    locked.current_points = locked.value_for(locked.solve_count)
+    CTFChallenge.objects.filter(pk=locked.pk).update(
+        solve_count=locked.solve_count, current_points=locked.current_points
+    )
+    _shift_solvers(locked, locked.current_points - old_value, exclude_user=user)
+    challenge.solve_count, challenge.current_points = locked.solve_count, locked.current_points
+    return locked.current_points
+
+
+def reprice(challenge):
+    """
+    Bring the challenge's value in line with its settings and shift its
+    solvers by the difference. CTFChallenge.save() calls this whenever a
+    pricing field changes.
+    """
+    with transaction.atomic():
+        locked = CTFChallenge.objects.select_for_update(no_key=True).get(pk=challenge.pk)
+        new_value = locked.value_for(locked.solve_count)
+        if new_value != locked.current_points:
+            CTFChallenge.objects.filter(pk=locked.pk).update(current_points=new_value)
+            bump((CHALLENGE, locked.pk))
+            _shift_solvers(locked, new_value - locked.current_points)
+        challenge.current_points = new_value
+
+
+def recompute():
+    """
+    Derive every solve count, challenge value and player score from the
+    solves alone. Returns (challenge rows, {user_id: score}).
+    """
+    challenges = {}
+    for challenge in CTFChallenge.objects.annotate(solves=Count('completedchallenge')):
+        challenges[challenge.id] = {
+            'challenge': challenge,
+            'solve_count': challenge.solves,
+            'current_points': challenge.value_for(challenge.solves),
+        }
+    scores = defaultdict(int)
+    for user_id, challenge_id in CompletedChallenge.objects.values_list('user_id', 'challenge_id'):
+        scores[user_id] += challenges[challenge_id]['current_points']
+    return challenges, scores
+
+
+def verify(fix=False):
+    """
+    Compare the incrementally maintained counters and scores with a full
+    recomputation. Returns a list of human-readable differences; with
+    fix=True the recomputed values are written back.
+    """
+    challenges, scores = recompute()
+    differences = []
+    with transaction.atomic():
+        for row in challenges.values():
+            challenge = row['challenge']
+            for field in ('solve_count', 'current_points'):
+                if getattr(challenge, field) != row[field]:
+                    differences.append(f"challenge {challenge.id} {field}: {getattr(challenge, field)} != {row[field]}")
+            if fix and (challenge.solve_count, challenge.current_points) != (row['solve_count'], row['current_points']):
+                CTFChallenge.objects.filter(pk=challenge.pk).update(
+                    solve_count=row['solve_count'], current_points=row['current_points']
+                )
+                bump((CHALLENGE, challenge.pk))
+
+        for user_id, score in UserProfile.objects.values_list('user_id', 'score'):
+            expected = scores.get(user_id, 0)
+            if score != expected:
+                differences.append(f"user {user_id} score: {score} != {expected}")
+                if fix:
+                    UserProfile.objects.filter(user_id=user_id).update(score=expected)
+    if fix and differences:
+        invalidate()
+    return differences
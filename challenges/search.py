@@ -0,0 +1,79 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+# SQLite: FTS5 table kept in sync with challenges_ctfchallenge by triggers
+# (migration 0034_challenge_search)
+FTS_TABLE = "challenges_ctfchallenge_fts"
+# bm25 weights for the FTS columns (title, description, type)
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+MAX_TERMS = 10
+
+
+def search_vector():
+    """
+    The weighted tsvector the Postgres GIN index (0034_challenge_search) is
+    built on; queries must use this exact expression to hit the index, so a
+    change here needs a migration rebuilding the index with the new one.
+    """
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('type', weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    )
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def _search_sqlite(queryset, terms):
+    # every term must match, as a prefix so results follow the user's typing
+    match = " ".join(f'"{term}"*' for term in terms)
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    table = queryset.model._meta.db_table
+    # joining the FTS table lets SQLite run the MATCH once and look rows up by rowid
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+        # bm25 is lower for better matches
+        select={'search_rank': f"bm25({FTS_TABLE}, {weights})"},
+        order_by=['search_rank', 'id'],
+    )
+
+
+def _search_postgres(queryset, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    query = SearchQuery(" & ".join(f"{term}:*" for term in terms), config='english', search_type='raw')
+    return (
+        queryset.annotate(search_vector=search_vector())
+        .filter(search_vector=query)
+        .annotate(search_rank=SearchRank(search_vector(), query))
+        .order_by('-search_rank', 'id')
+    )
+
+
+def search(queryset, query):
+    """
+    Narrow a CTFChallenge queryset to challenges matching `query` in title,
+    description or type, best matches first. Served by the FTS5 index on
+    SQLite and the tsvector GIN index on Postgres; other databases fall back
+    to a LIKE scan.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, terms)
+    if connection.vendor == 'postgresql':
+        return _search_postgres(queryset, terms)
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term) | Q(type__icontains=term)
+    return queryset.filter(condition)
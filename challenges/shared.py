@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .backends import get_backend, RUNNING, STARTING, UNHEALTHY, MISSING
+from .models import CTFChallenge
+from .utils import shared_project_name
+
+# states in which a shared stack counts as up; anything else gets (re)started
+UP_STATES = (RUNNING, STARTING, UNHEALTHY)
+
+
+def _state_key(challenge_id):
+    return f"challenges:shared:{challenge_id}:state"
+
+
+def _ttl():
+    return getattr(settings, 'CHALLENGE_SHARED_STATE_TTL', 15)
+
+
+def set_shared_state(challenge, state):
+    cache.set(_state_key(challenge.id), state, _ttl())
+
+
+def get_shared_state(challenge, refresh=False):
+    """
+    Cached state of the challenge's shared stack. Only a cache miss (or
+    refresh=True) asks the container backend.
+    """
+    state = None if refresh else cache.get(_state_key(challenge.id))
+    if state is None:
+        state = get_backend().status(shared_project_name(challenge))
+        set_shared_state(challenge, state)
+    return state
+
+
+def extend_shared_deadline(challenge):
+    """
+    Someone asked for the running shared stack: push its reaping deadline a
+    full instance lifetime out, so it is only reaped once nobody has wanted
+    it for that long. A stack the reaper already claimed is left alone.
+    """
+    from django.utils import timezone
+    deadline = challenge.instance_deadline(timezone.now())
+    if CTFChallenge.objects.filter(pk=challenge.pk, shared_expires_at__isnull=False).update(shared_expires_at=deadline):
+        challenge.shared_expires_at = deadline
+
+
+def is_shared_up(challenge):
+    return get_shared_state(challenge) in UP_STATES
+
+
+def refresh_shared_states(projects=None):
+    """
+    Refresh every shared stack's cached state from a single backend list()
+    call (or an existing listing of the default daemon), so request paths
+    rarely miss the cache. Run by the status snapshot task.
+    """
+    if projects is None:
+        projects = get_backend().list()
+    challenges = CTFChallenge.objects.filter(is_isolated=False, is_static=False).exclude(compose_path__isnull=True).exclude(compose_path='')
+    cache.set_many(
+        {_state_key(c.id): projects.get(shared_project_name(c), MISSING) for c in challenges},
+        _ttl(),
+    )
@@ -0,0 +1,93 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .backends import get_backend, MISSING
+from .models import DockerNode
+
+logger = logging.getLogger(__name__)
+
+TAKEN_AT_KEY = "challenges:snapshot:taken_at"
+PROJECTS_KEY = "challenges:snapshot:projects"
+
+
+def _state_key(project_name):
+    return f"challenges:snapshot:project:{project_name}"
+
+
+def _ttl():
+    return getattr(settings, 'CHALLENGE_STATUS_SNAPSHOT_TTL', 15)
+
+
+def refresh_snapshot():
+    """
+    Scheduler task: list every compose project on the default daemon and
+    each active node (one call per daemon) and publish their states to the
+    shared cache, one key per project so readers fetch only what they show.
+    Also refreshes the shared stacks' cached states from the same listing.
+    """
+    from .shared import refresh_shared_states
+
+    states = {}
+    for node in [None, *DockerNode.objects.filter(is_active=True)]:
+        try:
+            projects = get_backend(node).list()
+        except Exception as e:
+            # keep this node's previous states until they expire rather than report it empty
+            logger.warning("Failed to list containers on %s: %s", node or 'default', e)
+            continue
+        if node is None:
+            refresh_shared_states(projects)
+        states.update(projects)
+
+    previous = cache.get(PROJECTS_KEY) or set()
+    gone = previous - states.keys()
+    if gone:
+        cache.delete_many([_state_key(name) for name in gone])
+    cache.set_many({_state_key(name): state for name, state in states.items()}, _ttl())
+    cache.set_many({PROJECTS_KEY: set(states), TAKEN_AT_KEY: time.time()}, _ttl())
+    return len(states)
+
+
+def set_container_state(project_name, state):
+    """
+    Record a state learnt between snapshots (e.g. from a Docker event).
+    """
+    if state == MISSING:
+        cache.delete(_state_key(project_name))
+    else:
+        cache.set(_state_key(project_name), state, _ttl())
+
+
+def container_state(project_name, started_at=None):
+    """
+    State of one project from the snapshot: a backend state constant,
+    MISSING if the daemon does not run it, or None if the snapshot cannot
+    tell - none is fresh (the scheduler is not running) or it predates
+    `started_at`.
+    """
+    return container_states({project_name: started_at})[project_name]
+
+
+def container_states(projects):
+    """
+    {project_name: state} for several projects with a single cache read.
+    `projects` is an iterable of names or a {name: started_at} mapping.
+    """
+    started = projects if isinstance(projects, dict) else dict.fromkeys(projects)
+    keys = {_state_key(name): name for name in started}
+    found = cache.get_many([*keys, TAKEN_AT_KEY])
+    taken_at = found.get(TAKEN_AT_KEY)
+    states = {}
+    for key, name in keys.items():
+        if taken_at is None:
+            states[name] = None
+        elif key in found:
+            states[name] = found[key]
+        elif started[name] is not None and started[name].timestamp() > taken_at:
+            states[name] = None
+        else:
+            states[name] = MISSING
+    return states
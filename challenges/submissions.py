@@ -0,0 +1,53 @@
+import hmac
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from user_management.models import UserProfile
+from user_management.scoreboard import record_solve
+from .models import CompletedChallenge
+from .scoring import count_solve
+
+CORRECT = 'correct'
+ALREADY_SOLVED = 'already_solved'
+INCORRECT = 'incorrect'
+
+MESSAGES = {
+    CORRECT: "Correct flag! Points awarded.",
+    ALREADY_SOLVED: "You have already completed this challenge.",
+    INCORRECT: "Incorrect flag. Try again!",
+}
+
+
+def check_flag(challenge, flag):
+    if not flag or not challenge.flag:
+        return False
+    return hmac.compare_digest(flag.encode(), challenge.flag.encode())
+
+
+def submit_flag(user, challenge, flag):
+    """
+    Check a flag and, if it is right, record the solve and award the points
+    in one short transaction. The unique (user, challenge) constraint decides
+    who solved first, so concurrent or repeated submissions are idempotent,
+    and the score is bumped with a single UPDATE ... SET score = score + n
+    instead of a read-modify-write. Dynamic challenges are re-priced in the
+    same transaction (see challenges.scoring).
+    Returns CORRECT, ALREADY_SOLVED or INCORRECT.
+    """
+    if not check_flag(challenge, flag.strip()):
+        return INCORRECT
+
+    try:
+        with transaction.atomic():
+            solve = CompletedChallenge.objects.create(user=user, challenge=challenge)
+            points = count_solve(challenge, user)
+            updated = UserProfile.objects.filter(user=user).update(
+                score=F('score') + points, last_solved_at=solve.completed_at
+            )
+            if not updated:
+                UserProfile.objects.create(user=user, score=points, last_solved_at=solve.completed_at)
+            record_solve(user.id, challenge)
+    except IntegrityError:
+        return ALREADY_SOLVED
+    return CORRECT
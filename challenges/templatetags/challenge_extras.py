@@ -18,3 +18,36 @@ def get_static_files(assets_path):
 @register.filter
 def basename(path):
     return os.path.basename(path)
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, parts):
+        self.nodelist = nodelist
+        self.name = name
+        self.parts = parts
+
+    def render(self, context):
+        from challenges.fragments import get_fragment, set_fragment
+
+        name = self.name.resolve(context)
+        parts = [part.resolve(context) for part in self.parts]
+        html = get_fragment(name, parts)
+        if html is None:
+            html = self.nodelist.render(context)
+            set_fragment(name, parts, html)
+        return html
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    {% fragment "name" part ... %}...{% endfragment %}: like {% cache %},
+    but keyed on the parts as given (pass the versions the block depends
+    on, see challenges.fragments) and counted in the hit/miss stats.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'fragment' needs a name")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
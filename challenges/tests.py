@@ -1,3 +1,750 @@
-from django.test import TestCase
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models.signals import pre_delete
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from user_management.models import UserProfile
+from . import backends, fragments, jobs, ports, reaper
+from .admission import dispatch_queue, fair_order
+from .backends import EXITED, MISSING, RUNNING
+from .events import handle_event
+from .jobs import enqueue_job, recover_stale_jobs, run_job, start_isolated_instance
+from .models import ActiveContainer, CompletedChallenge, CTFChallenge, DockerNode, PortLease, SchedulerLease, SpawnJob, WarmInstance
+from .pagination import paginate
+from .ports import allocate_port, port_usage, release_ports
+from .placement import NoCapacityError, node_loads, pick_node, place_instance
+from .search import search
+from .scheduler import PeriodicTask, acquire_lease, release_lease, run_due_tasks
+from .scoring import reprice, verify
+from .submissions import submit_flag, CORRECT, ALREADY_SOLVED, INCORRECT
+
+
+def make_challenge(title, **fields):
+    fields.setdefault('points', 100)
+    fields.setdefault('difficulty', 1)
+    fields.setdefault('type', 'web')
+    fields.setdefault('flag', f"flag{{{title}}}")
+    return CTFChallenge.objects.create(title=title, **fields)
+
+
+class FakeBackendMixin:
+    """
+    Every test starts with fresh in-memory daemons, one per node.
+    """
+
+    def setUp(self):
+        fake = override_settings(CHALLENGE_BACKEND='challenges.backends.FakeBackend', CHALLENGE_BACKEND_OPTIONS={})
+        fake.enable()
+        self.addCleanup(fake.disable)
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+
+    def drain_jobs(self):
+        """
+        Wait for everything handed to the worker pool (teardowns, refills).
+        """
+        if jobs._executor is not None:
+            jobs._executor.shutdown(wait=True)
+            jobs._executor = None
+
+
+class FakeBackendTestCase(FakeBackendMixin, TestCase):
+    pass
+
+
+def make_isolated(title, **fields):
+    fields.setdefault('compose_path', 'containers/captcha1')
+    fields.setdefault('internal_port', 80)
+    return make_challenge(title, is_isolated=True, **fields)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        for i in range(7):
+            make_challenge(f"c{i}", difficulty=1 + i % 3)
+        self.ordering = ('difficulty', 'id')
+        self.expected = list(CTFChallenge.objects.order_by(*self.ordering).values_list('id', flat=True))
+
+    def ids(self, page):
+        return [challenge.id for challenge in page]
+
+    def test_forward_walk_covers_every_row_once(self):
+        seen = []
+        page = paginate(CTFChallenge.objects.all(), self.ordering, per_page=3)
+        self.assertFalse(page.has_previous)
+        while True:
+            seen += self.ids(page)
+            if not page.has_next:
+                break
+            page = paginate(CTFChallenge.objects.all(), self.ordering, cursor=page.next_cursor, per_page=3)
+        self.assertEqual(seen, self.expected)
+
+    def test_backwards_returns_the_previous_page(self):
+        first = paginate(CTFChallenge.objects.all(), self.ordering, per_page=3)
+        second = paginate(CTFChallenge.objects.all(), self.ordering, cursor=first.next_cursor, per_page=3)
+        back = paginate(CTFChallenge.objects.all(), self.ordering, cursor=second.previous_cursor, per_page=3)
+        self.assertEqual(self.ids(second), self.expected[3:6])
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_descending_ordering(self):
+        ordering = ('-difficulty', '-id')
+        expected = list(CTFChallenge.objects.order_by(*ordering).values_list('id', flat=True))
+        first = paginate(CTFChallenge.objects.all(), ordering, per_page=4)
+        second = paginate(CTFChallenge.objects.all(), ordering, cursor=first.next_cursor, per_page=4)
+        self.assertEqual(self.ids(first) + self.ids(second), expected)
+        self.assertFalse(second.has_next)
+
+    def test_count_only_when_asked(self):
+        self.assertIsNone(paginate(CTFChallenge.objects.all(), self.ordering).count)
+        self.assertEqual(paginate(CTFChallenge.objects.all(), self.ordering, with_count=True).count, 7)
+
+    def test_tampered_cursor_restarts_from_the_first_page(self):
+        page = paginate(CTFChallenge.objects.all(), self.ordering, cursor='not-a-cursor', per_page=3)
+        self.assertEqual(self.ids(page), self.expected[:3])
+
+
+class FairOrderTests(TestCase):
+    def job(self, id, user_id, minute):
+        return SimpleNamespace(id=id, user_id=user_id, created_at=timezone.now() + timedelta(minutes=minute))
+
+    def test_round_robin_between_users(self):
+        # alice queued three before bob's first; bob still gets the second slot
+        jobs = [self.job(1, 'alice', 0), self.job(2, 'alice', 1), self.job(3, 'alice', 2), self.job(4, 'bob', 3)]
+        self.assertEqual([job.id for job in fair_order(jobs)], [1, 4, 2, 3])
+
+    def test_ties_within_a_round_go_by_queue_time(self):
+        jobs = [self.job(1, 'carol', 5), self.job(2, 'bob', 1), self.job(3, 'bob', 2), self.job(4, 'alice', 3)]
+        self.assertEqual([job.id for job in fair_order(jobs)], [2, 4, 1, 3])
+
+    @override_settings(CHALLENGE_MAX_INSTANCES=2, CHALLENGE_MAX_INSTANCES_PER_USER=None)
+    def test_dispatch_admits_in_fair_order_up_to_the_cap(self):
+        challenge = make_challenge('isolated', is_isolated=True)
+        alice = User.objects.create_user('alice')
+        bob = User.objects.create_user('bob')
+        first = SpawnJob.objects.create(user=alice, challenge=challenge, status=SpawnJob.QUEUED)
+        second = SpawnJob.objects.create(user=alice, challenge=challenge, status=SpawnJob.QUEUED)
+        bobs = SpawnJob.objects.create(user=bob, challenge=challenge, status=SpawnJob.QUEUED)
+
+        self.assertEqual(dispatch_queue(), 2)
+        statuses = dict(SpawnJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[first.id], SpawnJob.PENDING)
+        self.assertEqual(statuses[bobs.id], SpawnJob.PENDING)
+        self.assertEqual(statuses[second.id], SpawnJob.QUEUED)
+
+
+class DynamicScoringTests(TestCase):
+    def setUp(self):
+        self.challenge = make_challenge('dynamic', points=500, is_dynamic=True, minimum_points=100, decay=4)
+        self.players = [User.objects.create_user(f"player{i}") for i in range(3)]
+
+    def score(self, user):
+        return UserProfile.objects.get(user=user).score
+
+    def test_value_decays_to_the_minimum(self):
+        values = [self.challenge.value_for(n) for n in range(1, 8)]
+        self.assertEqual(values, [500, 475, 400, 275, 100, 100, 100])
+        self.assertEqual(make_challenge('static', points=300).value_for(10), 300)
+
+    def test_every_solver_holds_the_current_value(self):
+        for player in self.players:
+            self.assertEqual(submit_flag(player, self.challenge, self.challenge.flag), CORRECT)
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.challenge.solve_count, self.challenge.current_points), (3, 400))
+        self.assertEqual([self.score(player) for player in self.players], [400, 400, 400])
+        self.assertEqual(submit_flag(self.players[0], self.challenge, self.challenge.flag), ALREADY_SOLVED)
+        self.assertEqual(verify(), [])
+
+    def test_reprice_shifts_solvers_after_an_edit(self):
+        for player in self.players[:2]:
+            submit_flag(player, self.challenge, self.challenge.flag)
+        CTFChallenge.objects.filter(pk=self.challenge.pk).update(points=600)
+        self.challenge.refresh_from_db()
+        reprice(self.challenge)
+        self.assertEqual(self.challenge.current_points, self.challenge.value_for(2))
+        self.assertEqual([self.score(player) for player in self.players[:2]], [self.challenge.current_points] * 2)
+
+    def test_editing_the_pricing_reprices_on_save(self):
+        stale = CTFChallenge.objects.get(pk=self.challenge.pk)
+        for player in self.players[:2]:
+            submit_flag(player, self.challenge, self.challenge.flag)
+        # loaded before the solves: its counters must not be written back
+        stale.decay = 2
+        stale.save()
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.challenge.solve_count, self.challenge.current_points), (2, 400))
+        self.assertEqual([self.score(player) for player in self.players[:2]], [400, 400])
+        self.assertEqual(verify(), [])
+
+    def test_other_edits_do_not_reprice(self):
+        submit_flag(self.players[0], self.challenge, self.challenge.flag)
+        challenge = CTFChallenge.objects.get(pk=self.challenge.pk)
+        challenge.description = "now with a hint"
+        with self.assertNumQueries(1):
+            challenge.save()
+        challenge.points = 700
+        with self.assertNumQueries(1):
+            challenge.save(update_fields=['description'])
+
+    def test_verify_reports_and_fixes_drift(self):
+        submit_flag(self.players[0], self.challenge, self.challenge.flag)
+        CTFChallenge.objects.filter(pk=self.challenge.pk).update(solve_count=5)
+        UserProfile.objects.filter(user=self.players[0]).update(score=1)
+
+        differences = verify()
+        self.assertEqual(len(differences), 2)
+        self.assertEqual(verify(fix=True), differences)
+        self.assertEqual(verify(), [])
+        self.assertEqual(self.score(self.players[0]), 500)
+
+
+class PlacementTests(FakeBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.challenge = make_isolated('placed', memory_reservation_mb=256)
+        self.a = DockerNode.objects.create(name='a', base_url='tcp://a:2376', public_host='a.example', max_instances=2)
+        self.b = DockerNode.objects.create(name='b', base_url='tcp://b:2376', public_host='b.example', max_instances=2)
+
+    def placed(self, count):
+        return [place_instance(self.challenge, f"p{i}")[1].name for i in range(count)]
+
+    def test_instances_go_to_the_least_loaded_node(self):
+        self.assertEqual(sorted(self.placed(4)), ['a', 'a', 'b', 'b'])
+        loads = node_loads()
+        self.assertEqual([loads[node.id]['instances'] for node in (self.a, self.b)], [2, 2])
+
+    def test_spawns_still_starting_count_against_capacity(self):
+        # no ActiveContainer rows yet: only the leases taken at placement
+        self.placed(4)
+        with self.assertRaises(NoCapacityError):
+            place_instance(self.challenge, 'one-too-many')
+        self.assertFalse(PortLease.objects.filter(project_name='one-too-many').exists())
+
+    def test_memory_capacity(self):
+        DockerNode.objects.update(max_instances=None, memory_capacity_mb=512)
+        self.assertEqual(sorted(self.placed(4)), ['a', 'a', 'b', 'b'])
+        self.assertEqual(node_loads()[self.a.id]['memory_mb'], 512)
+        with self.assertRaises(NoCapacityError):
+            pick_node(self.challenge)
+
+    def test_draining_and_inactive_nodes(self):
+        self.b.is_draining = True
+        self.b.save()
+        self.assertEqual(self.placed(2), ['a', 'a'])
+        with self.assertRaises(NoCapacityError):
+            pick_node(self.challenge)
+        # with no active node at all, everything runs on the default daemon
+        DockerNode.objects.update(is_active=False)
+        self.assertIsNone(pick_node(self.challenge))
+
+    def test_start_runs_the_project_on_the_chosen_node(self):
+        self.placed(1)
+        host_port, node = start_isolated_instance(self.challenge, 'started')
+        self.assertEqual(node, self.b)
+        self.assertIn('started', backends.get_backend(self.b).projects)
+        self.assertNotIn('started', backends.get_backend(self.a).projects)
+        self.assertEqual(PortLease.objects.get(project_name='started').port, host_port)
+
+
+@override_settings(CHALLENGE_PUBLIC_HOST='ctf.example')
+class JobStatusTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.client.force_login(self.alice)
+
+    def status(self, job):
+        return self.client.get(reverse('job_status', args=[job.id])).json()
+
+    def test_links_use_the_host_the_instance_runs_on(self):
+        node = DockerNode.objects.create(name='a', base_url='tcp://a:2376', public_host='a.example')
+        isolated = make_challenge('isolated', is_isolated=True)
+        ActiveContainer.objects.create(user=self.alice, challenge=isolated, project_name='p', host_port=20001, node=node)
+        job = SpawnJob.objects.create(user=self.alice, challenge=isolated, status=SpawnJob.READY)
+        self.assertEqual((self.status(job)['public_host'], self.status(job)['host_port']), ('a.example', 20001))
+
+        shared = make_challenge('shared', host_port=8080)
+        job = SpawnJob.objects.create(user=self.alice, challenge=shared, status=SpawnJob.READY)
+        self.assertEqual((self.status(job)['public_host'], self.status(job)['host_port']), ('ctf.example', 8080))
+
+    def test_other_players_see_shared_jobs_but_not_their_errors(self):
+        bob = User.objects.create_user('bob')
+        shared = make_challenge('shared')
+        job = SpawnJob.objects.create(user=bob, challenge=shared, status=SpawnJob.FAILED, error="compose: /srv/ctf/secret")
+        self.assertEqual(self.status(job)['status'], SpawnJob.FAILED)
+        self.assertNotIn('secret', self.status(job)['error'])
+
+        isolated = make_challenge('isolated', is_isolated=True)
+        job = SpawnJob.objects.create(user=bob, challenge=isolated)
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).status_code, 404)
+
+
+class RecoverStaleJobsTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.challenge = make_challenge('shared')
+
+    def job(self, status, seconds_ago):
+        job = SpawnJob.objects.create(user=self.alice, challenge=self.challenge, status=status)
+        SpawnJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(seconds=seconds_ago))
+        return job
+
+    @override_settings(CHALLENGE_JOB_PENDING_STALE_AFTER=30, CHALLENGE_JOB_STALE_AFTER=900)
+    def test_pending_jobs_are_resubmitted_long_before_starting_ones_fail(self):
+        lost = self.job(SpawnJob.PENDING, 60)
+        self.job(SpawnJob.PENDING, 5)
+        self.job(SpawnJob.STARTING, 60)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(recover_stale_jobs(), (1, 0))
+        self.assertEqual(len(callbacks), 1)
+        # the resubmission touched it, so the next round leaves it alone
+        with self.captureOnCommitCallbacks():
+            self.assertEqual(recover_stale_jobs(), (0, 0))
+        self.assertEqual(SpawnJob.objects.get(pk=lost.pk).status, SpawnJob.PENDING)
+
+
+class SchedulerLeaseTests(TransactionTestCase):
+    def expire(self):
+        SchedulerLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_only_one_holder_until_the_lease_goes_stale(self):
+        self.assertTrue(acquire_lease('a', 30))
+        self.assertFalse(acquire_lease('b', 30))
+        self.assertTrue(acquire_lease('a', 30))
+
+        # a's heartbeat stopped: b takes over and a cannot renew any more
+        self.expire()
+        self.assertTrue(acquire_lease('b', 30))
+        self.assertFalse(acquire_lease('a', 30))
+
+    def test_release_hands_over_at_once(self):
+        acquire_lease('a', 30)
+        release_lease('b')
+        self.assertFalse(acquire_lease('b', 30))
+        release_lease('a')
+        self.assertTrue(acquire_lease('b', 30))
+
+    def test_leader_stops_running_tasks_once_the_lease_is_taken_over(self):
+        ran = []
+
+        def taken_over():
+            ran.append('first')
+            SchedulerLease.objects.update(holder='b', expires_at=timezone.now() + timedelta(seconds=30))
+            time.sleep(0.5)
+
+        tasks = [PeriodicTask('first', taken_over, 60), PeriodicTask('second', lambda: ran.append('second'), 60)]
+        acquire_lease('a', 0.3)
+        self.assertFalse(run_due_tasks(tasks, 'a', 0.3))
+        self.assertEqual(ran, ['first'])
+        self.assertEqual(SchedulerLease.objects.get().holder, 'b')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("the FTS5 index is SQLite's; other databases are covered by their own backends")
+        # created first, so only the ranking can put the title match ahead
+        self.crypto = make_challenge('Padding oracle', description="Bake a cookie from ciphertext", type='crypto')
+        self.web = make_challenge('Cookie monster', description="Steal the admin session", type='web')
+
+    def titles(self, query):
+        return [challenge.title for challenge in search(CTFChallenge.objects.all(), query)]
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        self.assertEqual(self.titles('oracle'), ['Padding oracle'])
+        self.crypto.title = 'Bit flipper'
+        self.crypto.save()
+        self.assertEqual(self.titles('oracle'), [])
+        self.assertEqual(self.titles('flip'), ['Bit flipper'])
+        self.crypto.delete()
+        self.assertEqual(self.titles('flip'), [])
+        self.assertEqual(self.titles('ciphertext'), [])
+
+    def test_terms_are_prefixes_and_all_must_match(self):
+        self.assertEqual(self.titles('ses adm'), ['Cookie monster'])
+        self.assertEqual(self.titles('cookie ciphertext'), ['Padding oracle'])
+        self.assertEqual(self.titles('cookie nothing'), [])
+        self.assertEqual(len(self.titles('!!')), 2)
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.titles('cookie'), ['Cookie monster', 'Padding oracle'])
+
+
+class JobLifecycleTests(FakeBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.challenge = make_isolated('isolated')
+
+    def test_unfinished_jobs_are_reused(self):
+        job = enqueue_job(self.alice, self.challenge, SpawnJob.SPAWN)
+        self.assertEqual(enqueue_job(self.alice, self.challenge, SpawnJob.SPAWN), job)
+        self.assertNotEqual(enqueue_job(self.bob, self.challenge, SpawnJob.SPAWN), job)
+
+        # everyone starting one shared stack waits on the same job
+        shared = make_challenge('shared', compose_path='containers/captcha1')
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = enqueue_job(self.alice, shared, SpawnJob.SPAWN)
+            self.assertEqual(enqueue_job(self.bob, shared, SpawnJob.SPAWN), job)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_a_job_runs_once(self):
+        job = SpawnJob.objects.create(user=self.alice, challenge=self.challenge)
+        run_job(job.id)
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, SpawnJob.READY)
+        active = ActiveContainer.objects.get(user=self.alice)
+        self.assertEqual(backends.get_backend().calls.count(('up', active.project_name)), 1)
+        self.assertTrue(PortLease.objects.filter(project_name=active.project_name, port=active.host_port).exists())
+
+    def test_backend_errors_fail_the_job_and_free_its_port(self):
+        broken = make_isolated('broken', compose_path='containers/does-not-exist')
+        job = SpawnJob.objects.create(user=self.alice, challenge=broken)
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, SpawnJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertFalse(ActiveContainer.objects.exists())
+        self.assertFalse(PortLease.objects.exists())
+
+    def test_stop_removes_the_instance(self):
+        run_job(SpawnJob.objects.create(user=self.alice, challenge=self.challenge).id)
+        project_name = ActiveContainer.objects.get().project_name
+        run_job(SpawnJob.objects.create(user=self.alice, challenge=self.challenge, action=SpawnJob.STOP).id)
+        self.assertFalse(ActiveContainer.objects.exists())
+        self.assertFalse(PortLease.objects.exists())
+        self.assertNotIn(project_name, backends.get_backend().projects)
+
+    @override_settings(CHALLENGE_JOB_STALE_AFTER=900)
+    def test_jobs_whose_worker_died_are_failed(self):
+        dead = SpawnJob.objects.create(user=self.alice, challenge=self.challenge, status=SpawnJob.STARTING)
+        busy = SpawnJob.objects.create(user=self.bob, challenge=self.challenge, status=SpawnJob.STARTING)
+        SpawnJob.objects.filter(pk=dead.pk).update(updated_at=timezone.now() - timedelta(seconds=901))
+        self.assertEqual(recover_stale_jobs(), (0, 1))
+        statuses = dict(SpawnJob.objects.values_list('id', 'status'))
+        self.assertEqual((statuses[dead.id], statuses[busy.id]), (SpawnJob.FAILED, SpawnJob.STARTING))
+        # a failed job no longer blocks a retry
+        self.assertNotEqual(enqueue_job(self.alice, self.challenge, SpawnJob.SPAWN).id, dead.id)
+
+
+class ContainerEventTests(FakeBackendMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.challenge = make_isolated('isolated')
+        run_job(SpawnJob.objects.create(user=self.alice, challenge=self.challenge).id)
+        self.active = ActiveContainer.objects.get()
+        self.backend = backends.get_backend()
+
+    def deliver(self, *events):
+        for action, kwargs in events:
+            self.backend.emit(self.active.project_name, action, **kwargs)
+        self.backend.close_events()
+        for event in self.backend.events():
+            handle_event(event)
+            self.drain_jobs()
+
+    def test_healthy_marks_the_instance_ready(self):
+        self.assertEqual(self.active.status, ActiveContainer.STARTING)
+        self.deliver(('health_status: healthy', {}))
+        self.active.refresh_from_db()
+        self.assertEqual(self.active.status, ActiveContainer.READY)
+        self.assertIsNotNone(self.active.ready_at)
+
+    def test_oom_killed_instance_is_removed_and_can_be_respawned(self):
+        self.backend.set_state(self.active.project_name, EXITED)
+        with self.assertLogs('challenges.events', 'WARNING') as logs:
+            self.deliver(('oom', {}), ('die', {'exit_code': 137}))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('OOM-killed', logs.output[0])
+        self.assertFalse(ActiveContainer.objects.exists())
+        self.assertFalse(PortLease.objects.exists())
+        self.assertNotIn(self.active.project_name, self.backend.projects)
+        self.assertEqual(self.backend.calls.count(('down', self.active.project_name)), 1)
+
+        # the player can start a fresh one; the job is handed over on commit
+        with transaction.atomic():
+            job = enqueue_job(self.alice, self.challenge, SpawnJob.SPAWN)
+        self.drain_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, SpawnJob.objects.count()), (SpawnJob.READY, 2))
+        self.assertNotEqual(ActiveContainer.objects.get().project_name, self.active.project_name)
+
+    def test_die_of_a_restarted_container_is_ignored(self):
+        # a restart policy already brought it back by the time the event is seen
+        self.deliver(('die', {'exit_code': 1}))
+        self.assertTrue(ActiveContainer.objects.filter(pk=self.active.pk).exists())
+        self.assertEqual(self.backend.status(self.active.project_name), RUNNING)
+
+    def test_destroy_of_our_own_stop_changes_nothing(self):
+        run_job(SpawnJob.objects.create(user=self.alice, challenge=self.challenge, action=SpawnJob.STOP).id)
+        self.deliver(('die', {'exit_code': 0}), ('destroy', {}))
+        self.assertEqual(self.backend.calls.count(('down', self.active.project_name)), 1)
+        self.assertEqual(list(SpawnJob.objects.values_list('status', flat=True)), [SpawnJob.READY] * 2)
+
+    def test_warm_instances_are_cleaned_up_too(self):
+        ActiveContainer.objects.all().delete()
+        WarmInstance.objects.create(
+            challenge=self.challenge, project_name=self.active.project_name, host_port=self.active.host_port
+        )
+        self.backend.set_state(self.active.project_name, EXITED)
+        with self.assertLogs('challenges.events', 'WARNING'):
+            self.deliver(('die', {'exit_code': 137}))
+        self.assertFalse(WarmInstance.objects.exists())
+        self.assertNotIn(self.active.project_name, self.backend.projects)
+
+
+@override_settings(CHALLENGE_PORT_RANGE=(40000, 40009))
+class PortAllocatorTests(TestCase):
+    def setUp(self):
+        ports._cursors.clear()
+        self.addCleanup(ports._cursors.clear)
+        # nodes skip the local bind check, so the range is fully ours
+        self.a = DockerNode.objects.create(name='a', base_url='tcp://a:2376', public_host='a.example')
+        self.b = DockerNode.objects.create(name='b', base_url='tcp://b:2376', public_host='b.example')
+
+    def test_a_port_is_never_handed_out_twice_on_a_node(self):
+        leased = [allocate_port(f"p{i}", self.a) for i in range(10)]
+        self.assertEqual(sorted(leased), list(range(40000, 40010)))
+        with self.assertRaises(RuntimeError):
+            allocate_port('full', self.a)
+        # other daemons have their own ports
+        self.assertIn(allocate_port('elsewhere', self.b), range(40000, 40010))
+        self.assertEqual(port_usage(self.a)['free'], 0)
+
+    def test_allocation_wraps_around_the_range(self):
+        ports._cursors['a'] = 40008
+        self.assertEqual([allocate_port(f"p{i}", self.a) for i in range(3)], [40008, 40009, 40000])
+
+    def test_released_ports_are_reused(self):
+        ports._cursors['a'] = 40000
+        for i in range(10):
+            allocate_port(f"p{i}", self.a)
+        self.assertEqual(release_ports('p3'), 1)
+        self.assertEqual(release_ports('p3'), 0)
+        self.assertEqual(allocate_port('again', self.a), 40003)
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ReaperTests(FakeBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.challenge = make_isolated('isolated')
+        self.backend = backends.get_backend()
+        now = timezone.now()
+        self.expired = [self.instance(i, now - timedelta(minutes=3 - i)) for i in range(3)]
+        self.live = self.instance(3, now + timedelta(minutes=5))
+
+    def instance(self, i, expires_at):
+        user = User.objects.create_user(f"player{i}")
+        run_job(SpawnJob.objects.create(user=user, challenge=self.challenge).id)
+        active = ActiveContainer.objects.get(user=user)
+        ActiveContainer.objects.filter(pk=active.pk).update(expires_at=expires_at)
+        return active.project_name
+
+    def reap(self):
+        return reaper.reap_expired(executor=InlineExecutor())
+
+    def downs(self):
+        return [name for call, name in self.backend.calls if call == 'down']
+
+    def test_expired_instances_are_reaped_in_batches_oldest_first(self):
+        reaper.REAP_BATCH_SIZE, batch_size = 2, reaper.REAP_BATCH_SIZE
+        self.addCleanup(setattr, reaper, 'REAP_BATCH_SIZE', batch_size)
+        self.assertEqual(self.reap(), 2)
+        self.assertEqual(self.downs(), self.expired[:2])
+        self.assertEqual(self.reap(), 1)
+        self.assertEqual(self.reap(), 0)
+        self.assertEqual(self.downs(), self.expired)
+        self.assertEqual(list(ActiveContainer.objects.values_list('project_name', flat=True)), [self.live])
+        self.assertEqual(set(PortLease.objects.values_list('project_name', flat=True)), {self.live})
+
+    def test_deleting_the_row_is_the_claim(self):
+        claimed_elsewhere = []
+
+        def concurrent_stop(sender, instance, **kwargs):
+            # while this reaper claims the first row, another process claims the second
+            if not claimed_elsewhere:
+                claimed_elsewhere.append(self.expired[1])
+                ActiveContainer.objects.filter(project_name=self.expired[1]).delete()
+
+        pre_delete.connect(concurrent_stop, sender=ActiveContainer)
+        self.addCleanup(pre_delete.disconnect, concurrent_stop, sender=ActiveContainer)
+        self.assertEqual(self.reap(), 2)
+        self.assertEqual(self.downs(), [self.expired[0], self.expired[2]])
+
+    def test_shared_stacks_are_stopped_once(self):
+        shared = make_challenge('shared', compose_path='containers/captcha1')
+        run_job(SpawnJob.objects.create(user=User.objects.get(username='player0'), challenge=shared).id)
+        CTFChallenge.objects.filter(pk=shared.pk).update(shared_expires_at=timezone.now() - timedelta(seconds=1))
+        ActiveContainer.objects.all().delete()
+        self.assertEqual(self.reap(), 1)
+        self.assertEqual(self.reap(), 0)
+        self.assertEqual(self.downs(), [f"shared_ch{shared.pk}"])
+        self.assertEqual(self.backend.status(f"shared_ch{shared.pk}"), MISSING)
+        self.assertIsNone(reaper.next_deadline())
+
+
+class SubmitFlagTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.challenge = make_challenge('static', points=100)
+
+    def score(self):
+        return UserProfile.objects.get(user=self.alice).score
+
+    def test_repeated_submissions_award_the_points_once(self):
+        self.assertEqual(submit_flag(self.alice, self.challenge, " flag{static}\n"), CORRECT)
+        self.assertEqual(submit_flag(self.alice, self.challenge, "flag{static}"), ALREADY_SOLVED)
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.score(), self.challenge.solve_count), (100, 1))
+        self.assertEqual(CompletedChallenge.objects.count(), 1)
+
+    def test_losing_a_race_changes_nothing(self):
+        # another request of the same player recorded the solve first
+        CompletedChallenge.objects.create(user=self.alice, challenge=self.challenge)
+        self.assertEqual(submit_flag(self.alice, self.challenge, "flag{static}"), ALREADY_SOLVED)
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.score(), self.challenge.solve_count), (0, 0))
+
+    def test_points_are_added_to_the_stored_score(self):
+        profile = UserProfile.objects.get(user=self.alice)
+        UserProfile.objects.filter(pk=profile.pk).update(score=50)
+        submit_flag(self.alice, self.challenge, "flag{static}")
+        self.assertEqual(self.score(), 150)
+        self.assertIsNotNone(UserProfile.objects.get(pk=profile.pk).last_solved_at)
+
+    def test_players_without_a_profile_get_one(self):
+        UserProfile.objects.filter(user=self.alice).delete()
+        self.assertEqual(submit_flag(self.alice, self.challenge, "flag{static}"), CORRECT)
+        self.assertEqual(self.score(), 100)
+
+    def test_wrong_and_empty_flags(self):
+        self.assertEqual(submit_flag(self.alice, self.challenge, "flag{nope}"), INCORRECT)
+        self.assertEqual(submit_flag(self.alice, self.challenge, "  "), INCORRECT)
+        flagless = make_challenge('flagless', flag=None)
+        self.assertEqual(submit_flag(self.alice, flagless, ""), INCORRECT)
+        self.assertFalse(CompletedChallenge.objects.exists())
+
+
+class CatalogQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.client.force_login(self.alice)
+        self.add_challenges(3)
+
+    def add_challenges(self, count):
+        for i in range(CTFChallenge.objects.count(), CTFChallenge.objects.count() + count):
+            challenge = make_challenge(f"c{i}", difficulty=1 + i % 3, type=('web', 'crypto')[i % 2])
+            for player in User.objects.all():
+                submit_flag(player, challenge, challenge.flag)
+
+    def catalog_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('challenge_list') + query).status_code, 200)
+        return [q['sql'] for q in queries if 'challenges_' in q['sql']]
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        small = len(self.catalog_queries())
+        for i in range(5):
+            User.objects.create_user(f"player{i}")
+        self.add_challenges(20)
+        cache.clear()
+        self.assertEqual(len(self.catalog_queries()), small)
+        # facets and the overlay are cached by now: one query for the page
+        self.assertEqual(len(self.catalog_queries('?difficulty=2&type=web')), 1)
+
+    def test_a_cached_page_runs_no_catalog_queries(self):
+        self.catalog_queries()
+        # the session and the user, nothing else
+        with self.assertNumQueries(2):
+            self.client.get(reverse('challenge_list'))
+
+    def test_starting_an_instance_only_rebuilds_the_players_overlay(self):
+        self.catalog_queries()
+        isolated = CTFChallenge.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            ActiveContainer.objects.create(user=self.alice, challenge=isolated, project_name='p', host_port=20001)
+        rebuilt = self.catalog_queries()
+        self.assertTrue(rebuilt)
+        self.assertTrue(all('challenges_ctfchallenge' not in sql for sql in rebuilt))
+
+
+class FragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.challenge = make_challenge('Cookie monster')
+
+    def test_a_bump_takes_effect_on_commit(self):
+        before = fragments.versions((fragments.CHALLENGE, 1), (fragments.CHALLENGE, 2))
+        self.assertEqual(fragments.versions((fragments.CHALLENGE, 1), (fragments.CHALLENGE, 2)), before)
+        with self.captureOnCommitCallbacks() as callbacks:
+            fragments.bump((fragments.CHALLENGE, 1))
+        self.assertEqual(fragments.versions((fragments.CHALLENGE, 1))[0], before[0])
+        for callback in callbacks:
+            callback()
+        after = fragments.versions((fragments.CHALLENGE, 1), (fragments.CHALLENGE, 2))
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1], before[1])
+
+    def test_a_fragment_is_only_found_under_the_version_it_was_built_for(self):
+        built = fragments.cached('challenge', fragments.versions((fragments.CHALLENGE, 1)), lambda: 'old')
+        self.assertEqual(fragments.cached('challenge', fragments.versions((fragments.CHALLENGE, 1)), lambda: 'new'), built)
+        with self.captureOnCommitCallbacks(execute=True):
+            fragments.bump((fragments.CHALLENGE, 1))
+        self.assertEqual(fragments.cached('challenge', fragments.versions((fragments.CHALLENGE, 1)), lambda: 'new'), 'new')
+        self.assertEqual(fragments.stats()['challenge'], (1, 2, 1 / 3))
+
+    def test_a_lost_version_never_matches_old_fragments(self):
+        version = fragments.versions((fragments.CATALOG,))
+        cache.delete(fragments._version_key(fragments.CATALOG))
+        self.assertNotEqual(fragments.versions((fragments.CATALOG,)), version)
+
+    def test_edits_retire_the_rows_they_change(self):
+        catalog, row = fragments.versions((fragments.CATALOG,), (fragments.CHALLENGE, self.challenge.pk))
+        self.challenge.last_launched = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge.save(update_fields=['last_launched'])
+        self.assertEqual(fragments.versions((fragments.CATALOG,), (fragments.CHALLENGE, self.challenge.pk)), [catalog, row])
+
+        self.challenge.title = 'Cookie thief'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge.save()
+        new_catalog, new_row = fragments.versions((fragments.CATALOG,), (fragments.CHALLENGE, self.challenge.pk))
+        self.assertNotEqual((new_catalog, new_row), (catalog, row))
+
+    def test_the_cached_list_shows_an_edit(self):
+        user = User.objects.create_user('alice')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('challenge_list')), 'Cookie monster')
+        self.challenge.title = 'Cookie thief'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge.save()
+        response = self.client.get(reverse('challenge_list'))
+        self.assertContains(response, 'Cookie thief')
+        self.assertNotContains(response, 'Cookie monster')
+
+        # a solve retires the solver's overlay
+        solved_badge = f'tr[data-challenge="{self.challenge.pk}"] .solved-badge'
+        self.assertNotContains(response, solved_badge)
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_flag(user, self.challenge, self.challenge.flag)
+        self.assertContains(self.client.get(reverse('challenge_list')), solved_badge)
@@ -7,5 +7,6 @@ urlpatterns = [
     path("", challenge_list, name="challenge_list"),
     path('spawn/<int:pk>/', views.spawn_challenge, name='spawn_challenge'),
     path('stop/<int:pk>/', views.stop_challenge, name='stop_challenge'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('<int:pk>/', views.challenge_detail, name='challenge_detail'),
 ]
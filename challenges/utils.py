@@ -1,29 +1,14 @@
 import os
-import socket
-import tempfile
-import shutil
 import random
 import string
+import threading
 import yaml
-from pathlib import Path
 
-def find_free_port(start=20000, end=60000):
-    """
-    Returns a free TCP port on the host by trying to bind ephemeral sockets.
-    We select random ports in a range to avoid collisions.
-    """
-    for _ in range(100):
-        port = random.randint(start, end)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(('0.0.0.0', port))
-                return port
-            except OSError:
-                continue
-    # fallback: bind 0 to let OS pick (rare)
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('0.0.0.0', 0))
-        return s.getsockname()[1]
+from .backends import PLATFORM_LABEL, INSTANCE_LABEL
+
+# compose path -> ((mtime_ns, size), parsed compose model)
+_compose_cache = {}
+_compose_cache_lock = threading.Lock()
 
 
 def generate_project_name(user, challenge):
@@ -31,26 +16,52 @@ def generate_project_name(user, challenge):
     return f"user{user.id}_ch{challenge.id}_{rand}"
 
 
-def create_temp_compose_with_port(original_compose_path, original_internal_port, new_host_port):
+def shared_project_name(challenge):
+    return f"shared_ch{challenge.id}"
+
+
+def load_compose(compose_path):
     """
-    Copy the challenge's docker-compose.yml into the challenge base folder,
-    patch the ports, and save as a temporary compose file (unique name).
-    Returns the path to the new file and whether it was modified.
+    Parsed docker-compose model for the given file. The parse is cached per
+    path and reused until the file's mtime or size changes.
+    Callers must treat the returned dict as read-only.
     """
     # Ensure the original compose exists
-    if not os.path.isfile(original_compose_path):
-        raise FileNotFoundError(f"Compose file not found: {original_compose_path}")
+    if not os.path.isfile(compose_path):
+        raise FileNotFoundError(f"Compose file not found: {compose_path}")
+
+    stat = os.stat(compose_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _compose_cache_lock:
+        cached = _compose_cache.get(compose_path)
+    if cached and cached[0] == key:
+        return cached[1]
 
-    # Load the original docker-compose.yml
-    with open(original_compose_path, "r") as f:
+    with open(compose_path, "r") as f:
         compose = yaml.safe_load(f)
 
+    with _compose_cache_lock:
+        _compose_cache[compose_path] = (key, compose)
+    return compose
+
+
+def patch_compose_ports(compose, original_internal_port, new_host_port):
+    """
+    Return a copy of the compose model with every port mapping that targets
+    original_internal_port published on new_host_port, and whether anything
+    was changed. Only the services that are patched get copied; the rest of
+    the model is shared with the cached original.
+    """
+    compose = dict(compose)
+    services = dict(compose.get("services") or {})
+    compose["services"] = services
+
     modified = False
-    services = compose.get("services", {})
     for svc_name, svc in services.items():
         ports = svc.get("ports")
         if not ports:
             continue
+        svc_modified = False
         new_ports = []
         for p in ports:
             if isinstance(p, str):
@@ -60,11 +71,11 @@ def create_temp_compose_with_port(original_compose_path, original_internal_port,
                         container_port = int(container_part)
                         if container_port == original_internal_port:
                             if p.count(":") == 2:  # e.g. "127.0.0.1:49070:49070"
-                                new_p = f"{host_part.split(':')[0]}:{new_host_port}:{container_part}"
+                                new_p = f"{p.split(':')[0]}:{new_host_port}:{container_part}"
                             else:
                                 new_p = f"{new_host_port}:{container_part}"
                             new_ports.append(new_p)
-                            modified = True
+                            svc_modified = True
                             continue
                     except ValueError:
                         pass
@@ -73,32 +84,49 @@ def create_temp_compose_with_port(original_compose_path, original_internal_port,
                         container_port = int(p)
                         if container_port == original_internal_port:
                             new_ports.append(f"{new_host_port}:{container_port}")
-                            modified = True
+                            svc_modified = True
                             continue
                     except ValueError:
                         pass
                 new_ports.append(p)
             elif isinstance(p, dict):
-                target = p.get("target")
-                if target == original_internal_port:
-                    p["published"] = new_host_port
-                    modified = True
+                if p.get("target") == original_internal_port:
+                    p = dict(p, published=new_host_port)
+                    svc_modified = True
                 new_ports.append(p)
             else:
                 new_ports.append(p)
-        if modified:
-            svc["ports"] = new_ports
-            compose["services"][svc_name] = svc
-
-    # Save the modified docker-compose.yml into the challenge's base folder
-    base_dir = Path(original_compose_path).resolve().parent
-    tmp_file = base_dir / f"docker-compose.temp_{os.getpid()}_{random.randint(1000, 9999)}.yml"
+        if svc_modified:
+            services[svc_name] = dict(svc, ports=new_ports)
+            modified = True
 
-    with open(tmp_file, "w") as f:
-        yaml.safe_dump(compose, f)
+    return compose, modified
 
-    print("DEBUG created temporary compose file:", tmp_file)
-    return str(tmp_file), modified
 
+def label_compose(compose, project_name):
+    """
+    Return a copy of the compose model with the platform labels on every
+    service, so reconciliation can find our containers in one listing.
+    """
+    compose = dict(compose)
+    services = {}
+    for svc_name, svc in (compose.get("services") or {}).items():
+        labels = svc.get("labels") or {}
+        if isinstance(labels, list):
+            labels = dict(label.split("=", 1) if "=" in label else (label, "") for label in labels)
+        services[svc_name] = dict(svc, labels={**labels, PLATFORM_LABEL: "true", INSTANCE_LABEL: project_name})
+    compose["services"] = services
+    return compose
 
 
+def compose_with_port(compose_path, original_internal_port, new_host_port):
+    """
+    The challenge's compose model with its ports patched for one instance,
+    built from the cached parse; nothing is written to disk.
+    Returns the model and whether it was modified.
+    """
+    return patch_compose_ports(
+        load_compose(compose_path),
+        original_internal_port,
+        new_host_port,
+    )
@@ -1,139 +1,166 @@
-import os
-import subprocess
-from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from .models import CTFChallenge, CompletedChallenge, ActiveContainer
+from .models import CTFChallenge, CompletedChallenge, ActiveContainer, SpawnJob
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, get_object_or_404, redirect
-from .utils import generate_project_name, find_free_port, create_temp_compose_with_port
+from .catalog import catalog_challenges, facets, user_overlay
+from .fragments import CATALOG, CHALLENGE, USER, cached, versions
+from .search import search
+from .pagination import paginate
+from .admission import AdmissionQueueFull, admission_lease, can_admit_now, queue_position
+from .jobs import enqueue_job
+from .pool import claim_warm_instance
+from .shared import extend_shared_deadline, is_shared_up
+from .submissions import submit_flag, MESSAGES, INCORRECT
 from django.contrib import messages
-from user_management.models import UserProfile
-import time
+
+
+SHARED_JOB_ERROR = "The shared environment failed to start. Try again."
+
+
+def _wants_json(request):
+    return (
+        request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('accept', '')
+    )
+
+
+def _job_payload(job, viewer):
+    """
+    What the poller needs about a job. A shared stack's job is polled by
+    every player waiting on it; only its owner sees why it failed.
+    """
+    payload = {
+        'job_id': job.id,
+        'action': job.action,
+        'status': job.status,
+        'error': job.error if not job.error or job.user_id == viewer.id else SHARED_JOB_ERROR,
+        'status_url': reverse('job_status', args=[job.id]),
+        'public_host': None,
+        'host_port': None,
+        'instance_status': None,
+        'container_state': None,
+        'queue_position': queue_position(job),
+    }
+    if job.action == SpawnJob.SPAWN and job.status == SpawnJob.READY:
+        if job.challenge.is_isolated:
+            active = ActiveContainer.objects.filter(user=job.user, challenge=job.challenge).select_related('node').first()
+            if active:
+                payload['public_host'] = active.public_host
+                payload['host_port'] = active.host_port
+                payload['instance_status'] = active.status
+                payload['container_state'] = active.container_state
+        else:
+            payload['public_host'] = job.challenge.public_host
+            payload['host_port'] = job.challenge.host_port
+    return payload
 
 
 @login_required
 def spawn_challenge(request, pk):
+    """
+    Queue a start job for the challenge environment and return immediately.
+    The actual docker-compose work runs in the worker pool (see challenges.jobs).
+    """
     challenge = get_object_or_404(CTFChallenge, pk=pk)
-    base_dir = os.path.abspath(challenge.compose_path)
-    compose_file = os.path.join(base_dir, "docker-compose.yml")
-
-    # print("compose_dir =", base_dir)
-    # print("compose_file =", compose_file)
 
     # Static challenges: nothing to spawn, just show files/URL
     if challenge.is_static or not challenge.compose_path:
         messages.info(request, "This challenge does not require starting a container.")
         return redirect('challenge_detail', pk=pk)
 
-    # Shared challenge: run shared compose once and show its host_port
-    if not challenge.is_isolated:
-        # optional: only bring up if not already up
-        project_name = f"shared_ch{challenge.id}"
-        try:
-            subprocess.run(
-                ["docker-compose", "-p", project_name, "-f", compose_file, "up", "-d"],
-                cwd=base_dir,
-                check=True,
-                # stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            messages.success(request, "Shared challenge environment started (if not already).")
-        except subprocess.CalledProcessError as e:
-            messages.error(request, f"Error starting shared container: {e.stderr.decode() if e.stderr else str(e)}")
-        return redirect('challenge_detail', pk=pk)
-
-    # ====== Isolated challenge (per-user instance) ======
-    existing = ActiveContainer.objects.filter(user=request.user, challenge=challenge).first()
-    if existing:
+    if challenge.is_isolated and ActiveContainer.objects.filter(user=request.user, challenge=challenge).exists():
+        if _wants_json(request):
+            return JsonResponse({'status': SpawnJob.READY, 'detail': "You already have an active instance."})
         messages.info(request, "You already have an active instance for this challenge.")
         return redirect('challenge_detail', pk=pk)
 
-    # find a free host port
-    host_port = find_free_port()
-
-    # create temp compose
-    compose_file = os.path.join(challenge.compose_path, "docker-compose.yml")
-    tmp_compose_path, modified = create_temp_compose_with_port(
-        compose_file,
-        challenge.internal_port,
-        host_port
-    )
-
-    project_name = generate_project_name(request.user, challenge)
-    base_dir = os.path.abspath(challenge.compose_path)
-
-    # === Run docker-compose without check=True, capture all output ===
-    result = subprocess.run(
-        ["docker-compose", "-p", project_name, "-f", tmp_compose_path, "up", "-d"],
-        cwd=base_dir,
-        check=True,
-    )
+    # Shared stack already up (per the cached state): nothing to do
+    if not challenge.is_isolated and is_shared_up(challenge):
+        extend_shared_deadline(challenge)
+        if _wants_json(request):
+            return JsonResponse({
+                'status': SpawnJob.READY,
+                'public_host': challenge.public_host,
+                'host_port': challenge.host_port,
+            })
+        messages.info(request, "The shared challenge environment is already running.")
+        return redirect('challenge_detail', pk=pk)
 
-    if result.returncode != 0:
-        messages.error(request, f"Failed to start isolated container: {result.stderr}")
+    # Fast path: hand over a pre-started instance without queueing anything
+    active = None
+    if challenge.is_isolated:
+        with admission_lease() as held:
+            if held and can_admit_now(request.user, challenge):
+                active = claim_warm_instance(request.user, challenge)
+    if active:
+        if _wants_json(request):
+            return JsonResponse({
+                'status': SpawnJob.READY,
+                'public_host': active.public_host,
+                'host_port': active.host_port,
+                'instance_status': active.status,
+                'container_state': active.container_state,
+            })
+        messages.success(request, "Your isolated challenge instance has been launched.")
         return redirect('challenge_detail', pk=pk)
 
-    # Save ActiveContainer
-    ActiveContainer.objects.create(
-        user=request.user,
-        challenge=challenge,
-        project_name=project_name,
-        host_port=host_port,
-        compose_temp_path=tmp_compose_path
-    )
+    try:
+        job = enqueue_job(request.user, challenge, SpawnJob.SPAWN)
+    except AdmissionQueueFull as e:
+        if _wants_json(request):
+            response = JsonResponse({'status': 'rejected', 'error': str(e)}, status=429)
+        else:
+            messages.error(request, str(e))
+            response = redirect('challenge_detail', pk=pk)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+
+    if _wants_json(request):
+        return JsonResponse(_job_payload(job, request.user), status=202)
 
-    messages.success(request, "Your isolated challenge instance has been launched.")
+    if job.status == SpawnJob.QUEUED:
+        messages.info(request, f"All instance slots are busy; you are number {queue_position(job)} in the queue.")
+    else:
+        messages.info(request, "Your challenge environment is being started.")
     return redirect('challenge_detail', pk=pk)
 
 
 @login_required
 def stop_challenge(request, pk):
     """
-    Stop and remove the user's isolated container instance for a given challenge.
-    For shared challenges, optionally stop the shared container if admin.
+    Queue a stop job for the user's isolated instance, or the shared stack.
     """
     challenge = get_object_or_404(CTFChallenge, pk=pk)
 
-    if not challenge.is_isolated:
-        # optionally: stop shared container (be careful)
-        project_name = f"shared_ch{challenge.id}"
-        try:
-            subprocess.run(
-                ["docker-compose", "-p", project_name, "-f", challenge.compose_path, "down"],
-                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            messages.success(request, "Shared challenge environment stopped.")
-        except subprocess.CalledProcessError as e:
-            messages.error(request, f"Error stopping shared container: {e.stderr.decode() if e.stderr else str(e)}")
-        return redirect('challenge_detail', pk=pk)
-
-    # isolated -> find user's ActiveContainer
-    existing = ActiveContainer.objects.filter(user=request.user, challenge=challenge).first()
-    if not existing:
+    if challenge.is_isolated and not ActiveContainer.objects.filter(user=request.user, challenge=challenge).exists():
         messages.info(request, "You don't have an active instance to stop.")
         return redirect('challenge_detail', pk=pk)
 
-    try:
-        subprocess.run(
-            ["docker-compose", "-p", existing.project_name, "-f", existing.compose_temp_path, "down"],
-            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-    except subprocess.CalledProcessError as e:
-        messages.error(request, f"Error stopping container: {e.stderr.decode() if e.stderr else str(e)}")
-        # continue to remove DB record and temp file below
-
-    # cleanup temp compose file
-    try:
-        if existing.compose_temp_path and os.path.exists(existing.compose_temp_path):
-            os.remove(existing.compose_temp_path)
-    except Exception:
-        pass
+    job = enqueue_job(request.user, challenge, SpawnJob.STOP)
+    if _wants_json(request):
+        return JsonResponse(_job_payload(job, request.user), status=202)
 
-    existing.delete()
-    messages.success(request, "Your challenge instance has been stopped and removed.")
+    messages.success(request, "Your challenge instance is being stopped.")
     return redirect('challenge_detail', pk=pk)
 
 
+@login_required
+def job_status(request, job_id):
+    """
+    Lightweight polling endpoint reporting pending/starting/ready/failed.
+    """
+    job = get_object_or_404(
+        SpawnJob.objects.select_related('challenge').filter(Q(user=request.user) | Q(challenge__is_isolated=False)),
+        pk=job_id,
+    )
+    return JsonResponse(_job_payload(job, request.user))
+
+
 @login_required
 def challenge_detail(request, pk):
     challenge = get_object_or_404(CTFChallenge, pk=pk)
@@ -147,76 +174,89 @@ def challenge_detail(request, pk):
 
     if challenge.is_isolated:
         if request.user.is_authenticated:
-            active_container = ActiveContainer.objects.filter(user=request.user, challenge=challenge).first()
-    else:
-        pass
+            active_container = ActiveContainer.objects.filter(user=request.user, challenge=challenge).select_related('node').first()
+    container_state = active_container.container_state if active_container else None
+
+    pending_job = SpawnJob.objects.filter(
+        user=request.user,
+        challenge=challenge,
+        status__in=SpawnJob.UNFINISHED,
+    ).first()
 
     if request.method == 'POST':
-        flag = request.POST.get('flag', '').strip()
-        if flag and flag == challenge.flag:
-            if not already_completed:
-                # Mark challenge as completed
-                CompletedChallenge.objects.create(
-                    user=request.user,
-                    challenge=challenge,
-                    completed_at=timezone.now()
-                )
-
-                # Award points to UserProfile
-                profile = UserProfile.objects.get(user=request.user)
-                profile.score += challenge.points
-                profile.save()
-
-                message = "Correct flag! Points awarded."
-                already_completed = True
-            else:
-                message = "You have already completed this challenge."
-        else:
-            message = "Incorrect flag. Try again!"
+        result = submit_flag(request.user, challenge, request.POST.get('flag', ''))
+        message = MESSAGES[result]
+        already_completed = already_completed or result != INCORRECT
     return render(request, 'challenges/challenge_detail.html', {
         'challenge': challenge,
         "active_container": active_container,
+        "container_state": container_state,
         "shared_project_name": shared_project_name,
+        "pending_job": pending_job,
         'already_completed': already_completed,
+        'challenge_version': versions((CHALLENGE, challenge.id))[0],
         'message': message
     })
 
 
-@login_required
-def challenge_list(request):
-    challenges = CTFChallenge.objects.all()
-
-    # Filters
-    search_query = request.GET.get("search", "")
-    difficulty_filter = request.GET.get("difficulty", "")
-    type_filter = request.GET.get("type", "")
-
+def _catalog_page(search_query, difficulty_filter, type_filter, params):
+    challenges = catalog_challenges()
     if search_query:
-        challenges = challenges.filter(title__icontains=search_query)
+        challenges = search(challenges, search_query)
     if difficulty_filter:
         challenges = challenges.filter(difficulty=difficulty_filter)
     if type_filter:
         challenges = challenges.filter(type=type_filter)
 
-    # Pagination
-    paginator = Paginator(challenges, 10)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Pagination: search results by relevance (small and shallow), the
+    # catalog by a (difficulty, id) cursor so deep pages cost the same
+    if search_query:
+        return Paginator(challenges, 10).get_page(params.get("page"))
+    return paginate(
+        challenges,
+        ("difficulty", "id"),
+        cursor=params.get("cursor"),
+        per_page=10,
+        with_count=params.get("count") == "1",
+    )
 
-    # User progress
-    completed_ids = CompletedChallenge.objects.filter(user=request.user).values_list("challenge_id", flat=True)
 
-    difficulties = CTFChallenge.objects.values_list("difficulty", flat=True).distinct()
-    types = CTFChallenge.objects.values_list("type", flat=True).distinct()
+@login_required
+def challenge_list(request):
+    # Filters
+    search_query = request.GET.get("search", "")
+    difficulty_filter = request.GET.get("difficulty", "")
+    type_filter = request.GET.get("type", "")
+
+    # The table is the same for everyone and cached per page, keyed on the
+    # catalog version and on the version of every row shown; what differs
+    # per player (solved, instance running) is a small overlay cached per
+    # user. A page served from cache runs no catalog queries.
+    catalog_version, user_version = versions((CATALOG,), (USER, request.user.id))
+    page_key = [
+        catalog_version, search_query, difficulty_filter, type_filter,
+        request.GET.get("cursor", ""), request.GET.get("page", ""), request.GET.get("count", ""),
+    ]
+    built = {}
+
+    def build_page():
+        if "page" not in built:
+            built["page"] = _catalog_page(search_query, difficulty_filter, type_filter, request.GET)
+        return built["page"]
+
+    ids = cached("catalog_page", page_key, lambda: [challenge.id for challenge in build_page()])
+    row_versions = versions(*[(CHALLENGE, challenge_id) for challenge_id in ids])
 
     return render(request, "CTF/challenge_list.html", {
-        "page_obj": page_obj,
-        "difficulties": difficulties,
-        "types": types,
+        "page_obj": SimpleLazyObject(build_page),
+        "is_cursor_page": not search_query,
+        "catalog_key": [*page_key, *row_versions],
+        "overlay": SimpleLazyObject(lambda: user_overlay(request.user)),
+        "overlay_key": [request.user.id, user_version],
+        "facets": facets(),
         "search_query": search_query,
         "difficulty_filter": difficulty_filter,
         "type_filter": type_filter,
-        "completed_ids": completed_ids,
     })
 
 @require_POST
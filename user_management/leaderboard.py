@@ -0,0 +1,44 @@
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+
+from .models import UserProfile
+
+# score, then whoever reached it first (players who never solved last),
+# then signup order; the same expressions as userprofile_ranking_idx
+NEVER_SOLVED = ExpressionWrapper(Q(last_solved_at__isnull=True), output_field=BooleanField())
+RANKING = (F('score').desc(), NEVER_SOLVED.asc(), F('last_solved_at').asc(), F('id').asc())
+
+
+def ranked():
+    """
+    Profiles in leaderboard order, served by userprofile_ranking_idx.
+    """
+    return UserProfile.objects.select_related('user').order_by(*RANKING)
+
+
+def top(n=10):
+    return list(ranked()[:n])
+
+
+def rank_of(profile):
+    """
+    1-based position of the profile in ranked(), from one indexed COUNT of
+    the profiles placed ahead of it.
+    """
+    ahead = Q(score__gt=profile.score)
+    if profile.last_solved_at is None:
+        ahead |= Q(score=profile.score, last_solved_at__isnull=False)
+        ahead |= Q(score=profile.score, last_solved_at__isnull=True, id__lt=profile.id)
+    else:
+        ahead |= Q(score=profile.score, last_solved_at__lt=profile.last_solved_at)
+        ahead |= Q(score=profile.score, last_solved_at=profile.last_solved_at, id__lt=profile.id)
+    return UserProfile.objects.filter(ahead).count() + 1
+
+
+def around(profile, spread=2):
+    """
+    The profile with up to `spread` neighbours on either side, as
+    (rank, profile) pairs: one COUNT and one LIMIT/OFFSET query.
+    """
+    rank = rank_of(profile)
+    start = max(rank - 1 - spread, 0)
+    return list(enumerate(ranked()[start:rank + spread], start=start + 1))
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .scoreboard import scoreboard
+
+logger = logging.getLogger(__name__)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+def _row(entry):
+    return {'user_id': entry['user_id'], 'username': entry['username'], 'score': entry['score'], 'rank': entry['rank']}
+
+
+def diff_rows(previous, current):
+    """
+    Rows of `current` that are new or changed since `previous` (both
+    {user_id: row}), and the user ids that dropped out.
+    """
+    changed = [row for user_id, row in current.items() if previous.get(user_id) != row]
+    removed = [user_id for user_id in previous if user_id not in current]
+    return changed, removed
+
+
+class Broadcaster:
+    """
+    One per process: every SCOREBOARD_PUSH_INTERVAL seconds it reads the
+    scoreboard once, turns what changed into ready-to-send SSE messages and
+    drops the same bytes into every subscriber's queue, so the work per tick
+    does not grow with the number of viewers. It only runs while someone
+    is connected.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or getattr(settings, 'SCOREBOARD_STREAM_SIZE', 50)
+        self._subscribers = set()
+        self._task = None
+        self._rows = {}
+        self._solve_seq = None
+        self._snapshot = None
+
+    def _compute(self):
+        """
+        Runs in a worker thread: scoreboard reads may rebuild from the DB.
+        """
+        close_old_connections()
+        try:
+            rows = {entry['user_id']: _row(entry) for entry in scoreboard.top(self.size)}
+            solves, seq = scoreboard.solves_since(self._solve_seq if self._solve_seq is not None else float('inf'))
+        finally:
+            close_old_connections()
+
+        messages = []
+        changed, removed = diff_rows(self._rows, rows)
+        if changed or removed:
+            messages.append(sse('diff', {'changed': changed, 'removed': removed}))
+        messages += [sse('solve', solve) for solve in solves]
+        self._rows = rows
+        self._solve_seq = seq
+        self._snapshot = sse('snapshot', sorted(rows.values(), key=lambda row: row['rank']))
+        return messages
+
+    async def snapshot(self):
+        if self._snapshot is None:
+            await sync_to_async(self._compute)()
+        return self._snapshot
+
+    def _deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a client too slow to keep up skips the backlog and starts over from a snapshot
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self._snapshot)
+
+    async def _run(self):
+        interval = getattr(settings, 'SCOREBOARD_PUSH_INTERVAL', 1)
+        try:
+            while self._subscribers:
+                try:
+                    messages = await sync_to_async(self._compute)()
+                except Exception:
+                    logger.exception("Scoreboard broadcast failed")
+                    messages = []
+                for message in messages:
+                    for queue in list(self._subscribers):
+                        self._deliver(queue, message)
+                await asyncio.sleep(interval)
+        finally:
+            self._task = None
+            self._snapshot = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=getattr(settings, 'SCOREBOARD_STREAM_BUFFER', 100))
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+broadcaster = Broadcaster()
+
+
+async def stream(queue):
+    """
+    The SSE body for one client: a snapshot, then shared diff/solve messages
+    with keep-alive comments in between. Ends after SCOREBOARD_STREAM_MAX_AGE
+    seconds; EventSource reconnects by itself (and gets a fresh snapshot),
+    which also frees streams whose client went away unnoticed.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'SCOREBOARD_STREAM_MAX_AGE', 300)
+    keepalive = getattr(settings, 'SCOREBOARD_KEEPALIVE', 15)
+    try:
+        yield b"retry: 2000\n\n"
+        yield await broadcaster.snapshot()
+        while loop.time() < deadline:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=min(keepalive, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
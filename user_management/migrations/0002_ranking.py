@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def set_last_solved_at(apps, schema_editor):
+    UserProfile = apps.get_model("user_management", "UserProfile")
+    CompletedChallenge = apps.get_model("challenges", "CompletedChallenge")
+    solves = CompletedChallenge.objects.values("user").annotate(
+        last=Max("completed_at")
+    )
+    for row in solves:
+        UserProfile.objects.filter(user_id=row["user"]).update(
+            last_solved_at=row["last"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user_management", "0001_initial"),
+        ("challenges", "0031_ctfchallenge_max_instances_alter_spawnjob_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="last_solved_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="userprofile",
+            index=models.Index(
+                fields=["-score", "last_solved_at", "id"],
+                name="userprofile_ranking_idx",
+            ),
+        ),
+        migrations.RunPython(set_last_solved_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user_management", "0002_ranking"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="userprofile",
+            name="userprofile_ranking_idx",
+        ),
+        migrations.AddIndex(
+            model_name="userprofile",
+            index=models.Index(
+                models.OrderBy(models.F("score"), descending=True),
+                models.ExpressionWrapper(
+                    models.Q(("last_solved_at__isnull", True)),
+                    output_field=models.BooleanField(),
+                ),
+                models.F("last_solved_at"),
+                models.F("id"),
+                name="userprofile_ranking_idx",
+            ),
+        ),
+    ]
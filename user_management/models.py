@@ -1,11 +1,26 @@
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
+    last_solved_at = models.DateTimeField(blank=True, null=True)  # leaderboard tie-break: earlier solver ranks higher
+
+    class Meta:
+        indexes = [
+            # leaderboard order (user_management.leaderboard.RANKING); the IS NULL
+            # term puts players who never solved last without NULLS LAST,
+            # which SQLite cannot serve from an index
+            models.Index(
+                models.F('score').desc(),
+                models.ExpressionWrapper(models.Q(last_solved_at__isnull=True), output_field=models.BooleanField()),
+                'last_solved_at',
+                'id',
+                name='userprofile_ranking_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -13,4 +28,25 @@ class UserProfile(models.Model):
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+
+# keep every worker's in-memory scoreboard (user_management.scoreboard) in step
+
+@receiver(post_save, sender=UserProfile)
+def publish_profile(sender, instance, **kwargs):
+    from .scoreboard import record_profile
+    record_profile(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def publish_username(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'username' in update_fields):
+        from .scoreboard import record_profile
+        record_profile(instance.id)
+
+
+@receiver(post_delete, sender=UserProfile)
+def publish_removal(sender, instance, **kwargs):
+    from .scoreboard import record_removal
+    record_removal(instance.user_id)
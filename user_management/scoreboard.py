@@ -0,0 +1,307 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import leaderboard
+from .models import UserProfile
+from .skiplist import IndexableSkipList
+
+EPOCH_KEY = "scoreboard:epoch"
+VERSION_KEY = "scoreboard:version"
+
+# caches whose incr() is atomic, which the change log's versions rely on;
+# locmem only within one process (see challenges.checks)
+ATOMIC_INCR_CACHES = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+# kinds of change in the shared log; every change carries the players' full
+# new state, so replaying one twice is harmless
+SET = 'set'        # one player's new state (solve, admin edit, rename, new player)
+BULK = 'bulk'      # several players at once (dynamic scoring re-pricing a challenge)
+REMOVE = 'remove'
+
+
+def _change_key(version):
+    return f"scoreboard:change:{version}"
+
+
+def _entry(user_id, username, score, last_solved_at, profile_id):
+    return {
+        'user_id': user_id,
+        'username': username,
+        'score': score,
+        'last_solved_at': last_solved_at,
+        'profile_id': profile_id,
+    }
+
+
+def change_log_enabled():
+    """
+    Whether the cache can carry the change log. With one whose counters are
+    a read-modify-write (the file or database cache) two workers could
+    publish under the same version and one change would be lost, so the
+    scoreboard reads the database ranking instead.
+    """
+    return settings.CACHES.get('default', {}).get('BACKEND') in ATOMIC_INCR_CACHES
+
+
+def _sort_key(entry):
+    # same order as leaderboard.ranked(): score, earlier last solve, signup order
+    solved = entry['last_solved_at']
+    return (-entry['score'], solved.timestamp() if solved else float('inf'), entry['profile_id'])
+
+
+def _profile_entries(user_ids):
+    rows = UserProfile.objects.filter(user_id__in=user_ids).values(
+        'id', 'user_id', 'user__username', 'score', 'last_solved_at'
+    )
+    return [
+        _entry(row['user_id'], row['user__username'], row['score'], row['last_solved_at'], row['id'])
+        for row in rows
+    ]
+
+
+def _profile_entry(user_id):
+    entries = _profile_entries([user_id])
+    return entries[0] if entries else None
+
+
+def _profile(user_id):
+    return UserProfile.objects.select_related('user').filter(user_id=user_id).first()
+
+
+def _ranked_entry(profile, rank):
+    entry = _entry(profile.user_id, profile.user.username, profile.score, profile.last_solved_at, profile.id)
+    entry['rank'] = rank
+    return entry
+
+
+def _publish(kind, user_id, entry=None, solve=None):
+    """
+    Append a change to the shared log every worker replays. The version is
+    taken now, inside the caller's transaction, so row locks order the
+    versions of concurrent changes to one player; the change itself is only
+    written once the transaction commits. A rolled-back change leaves its
+    version empty, which readers treat as a gap and rebuild over.
+    """
+    if not change_log_enabled():
+        return
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 0, None)
+        version = cache.incr(VERSION_KEY)
+    change = (kind, user_id, entry, solve)
+    transaction.on_commit(
+        lambda: cache.set(_change_key(version), change, getattr(settings, 'SCOREBOARD_CHANGE_TTL', 3600))
+    )
+
+
+def record_solve(user_id, challenge=None):
+    """
+    Publish a player's new score after a solve. Call it inside the solve's
+    transaction, after the score update (see _publish). With the challenge,
+    the solve is also announced to live scoreboards.
+    """
+    entry = _profile_entry(user_id)
+    if entry:
+        solve = None
+        if challenge is not None:
+            solve = {'challenge_id': challenge.id, 'title': challenge.title, 'points': challenge.current_points}
+        _publish(SET, user_id, entry, solve)
+
+
+def record_adjustment(user_ids):
+    """
+    Publish the new state of every player whose score a bulk update changed,
+    as one log entry. Same transaction rule as record_solve.
+    """
+    entries = _profile_entries(user_ids)
+    if entries:
+        _publish(BULK, None, entries)
+
+
+def record_profile(user_id):
+    """
+    Publish a player's current state after any other change (new player,
+    admin edit, rename).
+    """
+    entry = _profile_entry(user_id)
+    if entry:
+        _publish(SET, user_id, entry)
+
+
+def record_removal(user_id):
+    _publish(REMOVE, user_id)
+
+
+def invalidate():
+    """
+    Make every worker rebuild from the database, for bulk score changes
+    that bypass the change log.
+    """
+    cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+
+
+class Scoreboard:
+    """
+    The leaderboard kept in process memory as an indexable skip list, so
+    top-N, rank and players-around-me are O(log n) with no database access.
+
+    Workers stay consistent through a change log in the shared cache: each
+    score change appends the players' new state under an increasing
+    version, and every read first replays the versions this process has not
+    seen (one or two cache reads). A changed epoch, a lagging log or a change that stays
+    missing (expired, or its transaction rolled back) rebuilds from UserProfile.
+
+    Without a cache that can carry the log (change_log_enabled()) every read
+    goes to the indexed database ranking in user_management.leaderboard.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ranking = None
+        self._entries = {}
+        self._by_profile = {}
+        self._epoch = None
+        self._version = 0
+        self._gap_since = None
+        # (sequence, announcement) for the latest solves replayed from the log
+        self._solves = deque(maxlen=getattr(settings, 'SCOREBOARD_RECENT_SOLVES', 100))
+        self._solve_seq = 0
+
+    def _rebuild(self, epoch):
+        version = cache.get(VERSION_KEY) or 0
+        entries = {
+            row['user_id']: _entry(row['user_id'], row['user__username'], row['score'], row['last_solved_at'], row['id'])
+            for row in leaderboard.ranked().values('id', 'user_id', 'user__username', 'score', 'last_solved_at')
+        }
+        # changes published while this ran are replayed next read; replaying is idempotent
+        self._ranking = IndexableSkipList(sorted(_sort_key(entry) for entry in entries.values()))
+        self._entries = entries
+        self._by_profile = {entry['profile_id']: entry for entry in entries.values()}
+        self._epoch = epoch
+        self._version = version
+        self._gap_since = None
+
+    def _apply(self, kind, user_id, entry, solve=None):
+        if solve:
+            self._solve_seq += 1
+            self._solves.append((self._solve_seq, dict(solve, user_id=user_id, username=entry['username'])))
+        if kind == BULK:
+            for player in entry:
+                self._apply(SET, player['user_id'], player)
+            return
+        current = self._entries.get(user_id)
+        if current:
+            self._ranking.remove(_sort_key(current))
+            del self._entries[user_id]
+            del self._by_profile[current['profile_id']]
+        if kind != REMOVE:
+            self._ranking.insert(_sort_key(entry))
+            self._entries[user_id] = entry
+            self._by_profile[entry['profile_id']] = entry
+
+    def sync(self):
+        state = cache.get_many([EPOCH_KEY, VERSION_KEY])
+        epoch = state.get(EPOCH_KEY)
+        if epoch is None:
+            cache.add(EPOCH_KEY, uuid.uuid4().hex, None)
+            epoch = cache.get(EPOCH_KEY)
+        version = state.get(VERSION_KEY) or 0
+
+        with self._lock:
+            max_lag = getattr(settings, 'SCOREBOARD_MAX_LAG', 1000)
+            if self._ranking is None or epoch != self._epoch or version - self._version > max_lag or version < self._version:
+                self._rebuild(epoch)
+                return
+            if version == self._version:
+                return
+
+            pending = range(self._version + 1, version + 1)
+            changes = cache.get_many([_change_key(v) for v in pending])
+            for v in pending:
+                change = changes.get(_change_key(v))
+                if change is None:
+                    # most likely published a moment ago; if it stays missing, it expired
+                    if self._gap_since is None:
+                        self._gap_since = time.monotonic()
+                    elif time.monotonic() - self._gap_since > getattr(settings, 'SCOREBOARD_GAP_TIMEOUT', 5):
+                        self._rebuild(epoch)
+                    return
+                self._apply(*change)
+                self._version = v
+                self._gap_since = None
+
+    def _ranked_slice(self, start, stop):
+        start = max(start, 0)
+        keys = self._ranking.slice(start, stop)
+        # the sort key ends with the profile id, which leads back to the entry
+        return [dict(self._by_profile[key[2]], rank=start + i + 1) for i, key in enumerate(keys)]
+
+    def top(self, n=10):
+        if not change_log_enabled():
+            return [_ranked_entry(profile, rank) for rank, profile in enumerate(leaderboard.top(n), start=1)]
+        self.sync()
+        with self._lock:
+            return self._ranked_slice(0, n)
+
+    def rank_of(self, user_id):
+        """
+        1-based rank of the player, or None if they have no profile.
+        """
+        if not change_log_enabled():
+            profile = _profile(user_id)
+            return leaderboard.rank_of(profile) if profile else None
+        self.sync()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return self._ranking.index(_sort_key(entry)) + 1 if entry else None
+
+    def around(self, user_id, spread=2):
+        """
+        The player with up to `spread` neighbours on either side.
+        """
+        if not change_log_enabled():
+            profile = _profile(user_id)
+            if profile is None:
+                return []
+            return [_ranked_entry(neighbour, rank) for rank, neighbour in leaderboard.around(profile, spread)]
+        self.sync()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return []
+            position = self._ranking.index(_sort_key(entry))
+            return self._ranked_slice(position - spread, position + spread + 1)
+
+    def solves_since(self, seq):
+        """
+        Solve announcements replayed after sequence number `seq`, and the
+        latest sequence number to pass next time. Solves are only announced
+        while the change log is enabled.
+        """
+        if not change_log_enabled():
+            return [], 0
+        self.sync()
+        with self._lock:
+            return [solve for n, solve in self._solves if n > seq], self._solve_seq
+
+    def __len__(self):
+        if not change_log_enabled():
+            return UserProfile.objects.count()
+        self.sync()
+        with self._lock:
+            return len(self._ranking)
+
+
+scoreboard = Scoreboard()
@@ -0,0 +1,151 @@
+import random
+
+
+class _Infinity:
+    """
+    Sorts after every key; the tail sentinel's key.
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return other is self
+
+    def __gt__(self, other):
+        return other is not self
+
+    def __ge__(self, other):
+        return True
+
+
+_INFINITY = _Infinity()
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # width[level]: how many positions next[level] skips ahead
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    Sorted collection of unique, comparable keys with O(log n) expected
+    insert, remove, rank (position of a key) and positional access, so a
+    leaderboard can answer "rank of X" and "who is #k" without scanning.
+    """
+
+    MAX_LEVELS = 32
+
+    def __init__(self, keys=()):
+        self._tail = _Node(_INFINITY, 0)
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._head.next = [self._tail] * self.MAX_LEVELS
+        self._size = 0
+        for key in keys:
+            self.insert(key)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._tail:
+            yield node.key
+            node = node.next[0]
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        steps = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self._random_levels()
+        new = _Node(key, levels)
+        skipped = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - skipped
+            prev.width[level] = skipped + 1
+            skipped += steps[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._tail or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def index(self, key):
+        """
+        0-based position of `key`; raises KeyError if it is absent.
+        """
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        if node.next[0].key != key or node.next[0] is self._tail:
+            raise KeyError(key)
+        return position
+
+    def _node_at(self, position):
+        node = self._head
+        remaining = position + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= remaining and node.next[level] is not self._tail:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, position):
+        if not 0 <= position < self._size:
+            raise IndexError(position)
+        return self._node_at(position).key
+
+    def slice(self, start, stop):
+        """
+        Keys at positions start..stop-1: O(log n) to find the first, then a
+        walk along the bottom level.
+        """
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
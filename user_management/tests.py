@@ -1,3 +1,148 @@
-from django.test import TestCase
+import random
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import leaderboard
+from .models import UserProfile
+from .scoreboard import Scoreboard, VERSION_KEY, _change_key, record_solve
+from .skiplist import IndexableSkipList
+
+
+class IndexableSkipListTests(SimpleTestCase):
+    def setUp(self):
+        random.seed(7)
+        self.keys = random.sample(range(10000), 500)
+        self.ranking = IndexableSkipList(self.keys)
+        self.expected = sorted(self.keys)
+
+    def test_iterates_in_order(self):
+        self.assertEqual(list(self.ranking), self.expected)
+        self.assertEqual(len(self.ranking), 500)
+
+    def test_rank_and_position_agree(self):
+        for position in (0, 1, 250, 499):
+            key = self.expected[position]
+            self.assertEqual(self.ranking.index(key), position)
+            self.assertEqual(self.ranking[position], key)
+        with self.assertRaises(KeyError):
+            self.ranking.index(-1)
+        with self.assertRaises(IndexError):
+            self.ranking[500]
+
+    def test_slice(self):
+        self.assertEqual(self.ranking.slice(10, 20), self.expected[10:20])
+        self.assertEqual(self.ranking.slice(-5, 3), self.expected[:3])
+        self.assertEqual(self.ranking.slice(495, 600), self.expected[495:])
+        self.assertEqual(self.ranking.slice(7, 7), [])
+
+    def test_remove_and_reinsert_keep_ranks_right(self):
+        for key in self.keys[:200]:
+            self.ranking.remove(key)
+        remaining = sorted(self.keys[200:])
+        self.assertEqual(list(self.ranking), remaining)
+        self.assertEqual(self.ranking.index(remaining[100]), 100)
+        with self.assertRaises(KeyError):
+            self.ranking.remove(self.keys[0])
+
+        # a leaderboard update: a player's key moves to the top
+        moved = remaining[150]
+        self.ranking.remove(moved)
+        self.ranking.insert(-1)
+        self.assertEqual(self.ranking.index(-1), 0)
+        self.assertEqual(self.ranking.slice(0, 3), [-1, remaining[0], remaining[1]])
+        self.assertEqual(len(self.ranking), 300)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # (username, score, minutes ago of last solve or None)
+        for username, score, ago in [
+            ('late', 300, 5), ('early', 300, 50), ('never', 0, None), ('low', 100, 1),
+            ('zero_solver', 0, 10), ('never_too', 0, None),
+        ]:
+            user = User.objects.create_user(username)
+            UserProfile.objects.filter(user=user).update(
+                score=score, last_solved_at=now - timedelta(minutes=ago) if ago is not None else None
+            )
+        self.order = ['early', 'late', 'low', 'zero_solver', 'never', 'never_too']
+
+    def test_top_orders_by_score_then_earlier_solve_then_signup(self):
+        self.assertEqual([p.user.username for p in leaderboard.top(10)], self.order)
+        self.assertEqual([p.user.username for p in leaderboard.top(2)], self.order[:2])
+
+    def test_rank_of_matches_the_ordering(self):
+        for profile in UserProfile.objects.select_related('user'):
+            self.assertEqual(leaderboard.rank_of(profile), self.order.index(profile.user.username) + 1)
+
+    def test_around(self):
+        profile = UserProfile.objects.get(user__username='low')
+        self.assertEqual(
+            [(rank, p.user.username) for rank, p in leaderboard.around(profile, spread=1)],
+            [(2, 'late'), (3, 'low'), (4, 'zero_solver')],
+        )
+
+    def test_top_is_served_by_the_ranking_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("query plan check is written for SQLite")
+        sql, params = leaderboard.ranked()[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('userprofile_ranking_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ScoreboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.board = Scoreboard()
+
+    def solve(self, user, points):
+        UserProfile.objects.filter(user=user).update(score=points, last_solved_at=timezone.now())
+        record_solve(user.id)
+
+    def test_changes_are_replayed_only_after_commit(self):
+        self.assertEqual(self.board.rank_of(self.bob.id), 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.solve(self.bob, 100)
+        self.assertIsNone(cache.get(_change_key(cache.get(VERSION_KEY))))
+        self.assertEqual(self.board.rank_of(self.bob.id), 2)
+
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.board.rank_of(self.bob.id), 1)
+
+    @override_settings(SCOREBOARD_GAP_TIMEOUT=0)
+    def test_rolled_back_change_is_never_applied(self):
+        self.board.top()
+        try:
+            with transaction.atomic():
+                self.solve(self.bob, 100)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        # the version taken by the rolled-back solve stays empty: a gap
+        self.assertEqual(self.board.top()[0]['username'], 'alice')
+        self.assertEqual(self.board.top()[0]['username'], 'alice')
+        self.assertEqual(self.board._version, cache.get(VERSION_KEY))
+
+    def test_falls_back_to_the_database_without_an_atomic_cache(self):
+        location = tempfile.mkdtemp()
+        file_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=file_cache):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.solve(self.bob, 100)
+            self.assertIsNone(cache.get(VERSION_KEY))
+            self.assertEqual([entry['username'] for entry in self.board.top(2)], ['bob', 'alice'])
+            self.assertEqual(self.board.rank_of(self.alice.id), 2)
+            self.assertEqual([entry['rank'] for entry in self.board.around(self.alice.id)], [1, 2])
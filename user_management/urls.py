@@ -10,6 +10,7 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path("edit-profile/", views.edit_profile, name="edit_profile"),
     path("dashboard/", views.dashboard_view, name="dashboard"),
+    path("scoreboard/stream/", views.scoreboard_stream, name="scoreboard_stream"),
     # Password Reset URLs
     path("password-reset/", auth_views.PasswordResetView.as_view(), name="password_reset"),
     path("password-reset/done/", auth_views.PasswordResetDoneView.as_view(), name="password_reset_done"),
@@ -1,10 +1,14 @@
 from .models import UserProfile
+from .scoreboard import scoreboard
+from .live import broadcaster, stream
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.core.mail import send_mail
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views import View
 from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
@@ -14,6 +18,7 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from challenges.models import CompletedChallenge
+from challenges.pagination import paginate
 
 
 @login_required
@@ -45,28 +50,47 @@ def edit_profile(request):
 
 @login_required
 def dashboard_view(request):
-    profile = UserProfile.objects.get(user=request.user)
-    logs = CompletedChallenge.objects.filter(user=request.user).select_related("challenge")
+    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    # Solve history, newest first, a cursor page at a time
+    logs = paginate(
+        CompletedChallenge.objects.filter(user=request.user).select_related("challenge"),
+        ("-completed_at", "-id"),
+        cursor=request.GET.get("logs_cursor"),
+        per_page=20,
+        with_count=request.GET.get("count") == "1",
+    )
     total_points = profile.score
 
-    # Leaderboard: directly from profile scores
-    users = UserProfile.objects.all()
-    leaderboard = [(u.user, u.score) for u in users]  # use u.user for username/email
-    leaderboard.sort(key=lambda x: x[1], reverse=True)
-
-    # Get current user's rank
-    rank = [u[0] for u in leaderboard].index(request.user) + 1
-
+    # Leaderboard: served from the in-memory scoreboard, no ranking queries
     return render(request, "dashboard.html", {
         "user": request.user,          # Django auth user
         "profile": profile,            # UserProfile object
         "logs": logs,
         "total_points": total_points,
-        "rank": rank,
-        "leaderboard": leaderboard[:10],
+        "rank": scoreboard.rank_of(request.user.id),
+        "leaderboard": scoreboard.top(10),
+        "around_me": scoreboard.around(request.user.id),
     })
 
 
+async def scoreboard_stream(request):
+    """
+    Server-sent events for live scoreboards: a snapshot of the top players,
+    then coalesced diffs and solve announcements. Logged-in players only,
+    like the dashboard. Under WSGI the stream would be buffered until it
+    ends, so it answers 204 instead, which tells EventSource not to retry;
+    the dashboard then keeps its server-rendered leaderboard.
+    """
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(stream(broadcaster.subscribe()), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
+
 @login_required
 def delete_account(request):
     if request.method == "POST":